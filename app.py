@@ -1,512 +1,600 @@
-from flask import Flask, request, Response, jsonify
-from weasyprint import HTML, CSS
-from weasyprint.text.fonts import FontConfiguration
+from flask import Flask, request, Response, jsonify, send_file, url_for, g
+from werkzeug.exceptions import BadRequest, HTTPException, RequestEntityTooLarge
+from app_logging import configure_logging
+from render_pool import AdmissionLimiter, RenderPool, RenderPoolBusy
+from render_context import PDF_PROFILE, PDF_PROFILES
+from pdf_cache import MemoryPDFCache, TieredPDFCache, payload_digest
+from jobs import JobManager
+from batch import BATCH_MAX_DOCUMENTS, BATCH_POOL_SIZE, iter_completed, iter_zip
+from notes_template import TEMPLATE_VERSION, documents_to_html, stylesheet_tag
+from normalize import PayloadError, normalize_payload
+from pdf_output import SharedSpoolFile, iter_file
+from single_flight import SingleFlight
+from concurrent.futures import Future
+import metrics
+import atexit
 import json
-import io
-import tempfile
+import logging
+import time
+import re
 import os
-from datetime import datetime
-import pytz
+from urllib.parse import quote
+
+configure_logging()
 
 app = Flask(__name__)
 
-def convert_json_to_html(data):
-    """Convert JSON data to HTML format with new layout including sentence data"""
+# A larger Content-Length is refused before anything is read, and a chunked
+# body raises 413 as soon as reading passes the limit
+app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('MAX_BODY_BYTES', 16 * 1024 * 1024))
+BODY_CHUNK_SIZE = 64 * 1024
+
+# Renders run in warm worker processes that already hold the shared fonts
+# and pre-parsed stylesheets (RENDER_POOL_SIZE=0 renders in-process)
+render_pool = RenderPool()
+atexit.register(render_pool.shutdown)
+
+# In-process rendering would take a batch one document at a time, so
+# batches then get a small process pool of their own, started on first use
+batch_pool = render_pool
+if render_pool.size <= 0 and BATCH_POOL_SIZE > 0:
+    batch_pool = RenderPool(
+        BATCH_POOL_SIZE,
+        admission=AdmissionLimiter(BATCH_POOL_SIZE, queue_size=2 * BATCH_POOL_SIZE)
+    )
+    atexit.register(batch_pool.shutdown)
+
+pdf_cache = TieredPDFCache()
+
+def cache_stat(name):
+    """Return one PDF cache statistic per tier, keyed for a CallbackMetric"""
+    return {(tier,): stats[name] for tier, stats in pdf_cache.stats().items()}
+
+for stat_name in ('hits', 'misses', 'evictions'):
+    metrics.register(metrics.CallbackMetric(
+        f'pdf_cache_{stat_name}_total', f'PDF cache {stat_name} by tier', 'counter', ('tier',),
+        lambda stat_name=stat_name: cache_stat(stat_name)
+    ))
+# Every worker sees the same spool directory, so its size is not summed
+metrics.register(metrics.CallbackMetric(
+    'pdf_cache_bytes', 'Bytes held by each PDF cache tier', 'gauge', ('tier',),
+    lambda: cache_stat('bytes'), mode={('disk',): 'max'}
+))
+
+# Concurrent requests for the same digest wait on one render instead of
+# each rendering the same PDF
+render_flights = SingleFlight()
+
+# ?format=html previews skip the render pool; they are cheap to rebuild, so
+# a small LRU of their own keeps them from evicting PDFs
+html_cache = MemoryPDFCache(int(os.environ.get('HTML_CACHE_MAX_BYTES', 8 * 1024 * 1024)))
+HTML_PREVIEW_MAX_AGE = int(os.environ.get('HTML_PREVIEW_MAX_AGE', 300))
+PREVIEW_CSS_MODES = ('inline', 'link')
+
+# URL prefix of an internal nginx location that serves PDF_SPOOL_DIR; when
+# set, PDFs already on disk are handed to nginx with X-Accel-Redirect
+# instead of being streamed by an app worker
+PDF_ACCEL_REDIRECT = os.environ.get('PDF_ACCEL_REDIRECT', '')
+
+# A digest names exactly one PDF, so GET /pdf/<digest> responses never change
+PDF_IMMUTABLE_MAX_AGE = int(os.environ.get('PDF_IMMUTABLE_MAX_AGE', 365 * 24 * 3600))
+DIGEST_PATTERN = re.compile('[0-9a-f]{64}')
+
+# Shown on / and rendered at startup to warm fonts, shaping caches and
+# WeasyPrint's lazy imports before traffic arrives
+EXAMPLE_PAYLOAD = {
+    'title': 'News Title',
+    'time': '2025-08-29T01:57:50.782-04:00',
+    'message': {
+        'content': 'News content...',
+        'title': 'News Title',
+        'time': '2025-08-29T01:57:50.782-04:00',
+        'sentence': '[{"word":"example","meaning_bn":"উদাহরণ","example_en":"This is an example sentence.","example_bn":"এটি একটি উদাহরণ বাক্য।"}]'
+    },
+    'output': [
+        {
+            'english': 'word',
+            'bengali': 'শব্দ',
+            'synonyms': ['synonym1', 'synonym2'],
+            'antonyms': ['antonym1', 'antonym2']
+        }
+    ]
+}
+
+# PID of the process whose warm-up render succeeded; forked workers have
+# to warm up themselves
+warmup = {'pid': None, 'error': None, 'duration_ms': None}
+
+def normalize(data, merge=False):
+    """Validate a payload into Documents, timing the normalize stage"""
+    with metrics.RENDER_STAGE_SECONDS.time('normalize'):
+        return normalize_payload(data, merge)
+
+def documents_digest(documents, merged=False, variant=''):
+    """Return the cache key and ETag for normalized documents"""
+    version = TEMPLATE_VERSION + ('+merge' if merged else '') + variant
+    return payload_digest([doc.canonical() for doc in documents], version)
+
+def build_html(documents, merged=False, styles=''):
+    """Build the HTML for normalized documents, timing the html stage"""
+    with metrics.RENDER_STAGE_SECONDS.time('html'):
+        return documents_to_html(documents, merged, styles=styles)
+
+def html_preview(documents, merged, css):
+    """Return the notes page as HTML for a browser preview, without PDF layout"""
+    digest = documents_digest(documents, merged, f'+html-{css}')
+    cache_headers = {'Cache-Control': f'private, max-age={HTML_PREVIEW_MAX_AGE}'}
+    if request.if_none_match.contains(digest):
+        response = Response(status=304, headers=cache_headers)
+        response.set_etag(digest)
+        return response
     
-    # Debug: Print the data structure
-    print(f"DEBUG: Data type: {type(data)}")
-    print(f"DEBUG: Data content: {data}")
+    body = html_cache.get(digest)
+    cache_headers['X-Cache'] = 'HIT' if body is not None else 'MISS'
+    if body is None:
+        if css == 'link':
+            styles = stylesheet_tag(url_for('static', filename='notes.css', v=TEMPLATE_VERSION))
+        else:
+            styles = stylesheet_tag()
+        body = build_html(documents, merged, styles).encode('utf-8')
+        html_cache.put(digest, body)
     
-    # Extract the data from different JSON structures
-    if isinstance(data, list) and len(data) > 0:
-        # Handle list format - take first item
-        first_item = data[0]
-        print(f"DEBUG: First item: {first_item}")
-        
-        # Ensure first_item is a dictionary
-        if not isinstance(first_item, dict):
-            print(f"DEBUG: First item is not a dict, type: {type(first_item)}")
-            first_item = {}
+    response = Response(body, mimetype='text/html', headers=cache_headers)
+    response.set_etag(digest)
+    return response
+
+def cache_output(digest, output):
+    """Cache a render output and return it as (pdf_bytes, None), or as
+    (None, source) for a PDF that was spooled to disk, see open_output"""
+    pdf_bytes, path = output
+    if path is None:
+        pdf_cache.put(digest, pdf_bytes)
+        return pdf_bytes, None
+    if os.path.getsize(path) > pdf_cache.disk.max_bytes:
+        # Too large to cache: unlinked now, readable by every waiter
+        return None, SharedSpoolFile(path)
+    pdf_cache.put_file(digest, path)
+    return None, pdf_cache.disk.path(digest)
+
+def open_output(source):
+    """Open the file source of a cache_output() result for reading"""
+    if isinstance(source, SharedSpoolFile):
+        return source.open()
+    return open(source, 'rb')
+
+def submit_shared_render(documents, digest, merged=False, profile=PDF_PROFILE,
+                         pool=render_pool):
+    """Return a Future of cache_output() for documents, shared by every
+    request for the same digest that arrives while the render is running"""
+    return render_flights.run(
+        digest,
+        lambda: pool.submit(build_html(documents, merged), profile),
+        lambda output: cache_output(digest, output)
+    )
+
+def send_pdf_file(path, etag=True):
+    """Send a PDF from disk as a download, through nginx when configured.
+
+    With PDF_ACCEL_REDIRECT set the response only carries headers and an
+    X-Accel-Redirect to the file; nginx sends the bytes with sendfile.
+    Files outside the spool directory are always sent by the app.
+    """
+    relative = os.path.relpath(path, pdf_cache.disk.directory)
+    if not PDF_ACCEL_REDIRECT or relative.startswith(os.pardir):
+        return send_file(
+            path,
+            mimetype='application/pdf',
+            as_attachment=True,
+            download_name='english_learning_notes.pdf',
+            etag=etag,
+            conditional=True
+        )
+    redirect = PDF_ACCEL_REDIRECT.rstrip('/') + '/' + quote(relative.replace(os.sep, '/'))
+    response = Response(
+        mimetype='application/pdf',
+        headers={
+            'Content-Disposition': 'attachment; filename=english_learning_notes.pdf',
+            'X-Accel-Redirect': redirect
+        }
+    )
+    if isinstance(etag, str):
+        response.set_etag(etag)
+    return response
+
+def content_address(response, digest):
+    """Point a PDF response at the GET URL that serves the same bytes"""
+    response.set_etag(digest)
+    response.headers['Location'] = url_for('get_pdf', digest=digest)
+    response.headers['X-Content-Digest'] = digest
+    return response
+
+def profile_variant(profile):
+    """Return the cache-key suffix for an output profile"""
+    return '' if profile == 'default' else f'+{profile}'
+
+def render_and_cache(documents, digest, merged=False, profile=PDF_PROFILE):
+    """Render documents to PDF, or join an identical render in flight, and
+    return (pdf_bytes, None) or (None, open_file) for a spooled PDF"""
+    render = submit_shared_render(documents, digest, merged, profile)
+    pdf_bytes, source = render.result(timeout=render_pool.timeout)
+    if source is None:
+        return pdf_bytes, None
+    return None, open_output(source)
+
+def submit_render(documents, profile=PDF_PROFILE, pool=render_pool):
+    """Return a Future of PDF bytes for documents, from the cache when possible"""
+    future = Future()
+    try:
+        digest = documents_digest(documents, variant=profile_variant(profile))
+        pdf_bytes, pdf_path = pdf_cache.get(digest)
+        if pdf_path is not None:
+            with open(pdf_path, 'rb') as f:
+                pdf_bytes = f.read()
+        if pdf_bytes is None:
+            def read_result(render_future):
+                try:
+                    pdf_bytes, source = render_future.result()
+                    if source is not None:
+                        with open_output(source) as f:
+                            pdf_bytes = f.read()
+                    future.set_result(pdf_bytes)
+                except Exception as e:
+                    future.set_exception(e)
+            
+            submit_shared_render(documents, digest, profile=profile, pool=pool).add_done_callback(read_result)
+            return future
+        future.set_result(pdf_bytes)
+    except Exception as e:
+        future.set_exception(e)
+    return future
+
+def submit_payload(data, profile=PDF_PROFILE, pool=render_pool):
+    """Normalize and submit one payload, reporting invalid ones through the Future"""
+    try:
+        documents = normalize(data)
+    except PayloadError as e:
+        future = Future()
+        future.set_exception(e)
+        return future
+    return submit_render(documents, profile, pool)
+
+def submit_admitted(submit, timeout):
+    """Call submit() for a Future, retrying while it is rejected with
+    RenderPoolBusy, for callers with no client waiting on a fast answer"""
+    deadline = time.monotonic() + timeout
+    while True:
+        future = submit()
+        # Admission is decided while submitting, so a rejection is already done
+        if not future.done() or not isinstance(future.exception(), RenderPoolBusy):
+            return future
+        retry_after = future.exception().retry_after
+        if time.monotonic() + retry_after > deadline:
+            return future
+        time.sleep(retry_after)
+
+def render_job(documents):
+    """Return PDF bytes for a background job, waiting out busy periods"""
+    render = submit_admitted(lambda: submit_render(documents), render_pool.timeout)
+    return render.result(timeout=render_pool.timeout)
+
+# Background executor for /jobs, separate from the request threads
+job_manager = JobManager(render_job)
+atexit.register(job_manager.shutdown)
+
+@app.before_request
+def start_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def log_request(response):
+    """Count the request and emit one structured access record for it"""
+    # The route pattern, not the path, keeps job ids out of the label set
+    endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    metrics.REQUESTS.inc(request.method, endpoint, str(response.status_code))
+    if app.logger.isEnabledFor(logging.INFO):
+        app.logger.info('request', extra={
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'duration_ms': round((time.perf_counter() - g.request_start) * 1000, 2),
+            'bytes': response.content_length,
+            'cache': response.headers.get('X-Cache')
+        })
+    return response
+
+def read_json_body():
+    """Read the request body in chunks under the size limit and parse it as JSON"""
+    # request.get_json() would silently truncate an oversized chunked body
+    # at the limit and fail with a parse error instead of a 413
+    chunks = []
+    while True:
+        chunk = request.stream.read(BODY_CHUNK_SIZE)
+        if not chunk:
+            break
+        chunks.append(chunk)
+    try:
+        return json.loads(b''.join(chunks))
+    except ValueError:
+        raise BadRequest('Request body is not valid JSON')
+
+@app.errorhandler(BadRequest)
+def bad_request(e):
+    """Answer malformed request bodies with a JSON error"""
+    return jsonify({'error': e.description}), 400
+
+@app.errorhandler(RequestEntityTooLarge)
+def body_too_large(e):
+    """Reject bodies over MAX_BODY_BYTES with a JSON error"""
+    limit = app.config['MAX_CONTENT_LENGTH']
+    return jsonify({'error': f'Request body exceeds the limit of {limit} bytes'}), 413
+
+@app.route('/convert-to-pdf', methods=['POST'])
+def convert_to_pdf():
+    """Convert JSON content to PDF and return as response"""
+    try:
+        # Get JSON data from request
+        if not request.is_json:
+            return jsonify({'error': 'Content-Type must be application/json'}), 400
         
-        if 'output' in first_item:
-            items = first_item['output']
-        elif 'data' in first_item:
-            items = first_item['data']
-        elif 'words' in first_item:
-            items = first_item['words']
-        else:
-            items = [first_item]
+        data = read_json_body()
         
-        # Get message from first item
-        message = ''
-        title = None
-        time = None
-        sentence_data = []
+        if not data:
+            return jsonify({'error': 'No JSON data provided'}), 400
         
-        print(f"DEBUG: Processing first_item with keys: {first_item.keys() if isinstance(first_item, dict) else 'Not a dict'}")
+        # ?merge=1 renders every item of a list payload into one PDF
+        merge = request.args.get('merge', '').lower() in ('1', 'true', 'yes')
+        if not isinstance(data, list):
+            merge = False
         
-        if 'message' in first_item:
-            print(f"DEBUG: Found 'message' key in first_item")
-            if isinstance(first_item['message'], dict):
-                print(f"DEBUG: 'message' is a dict with keys: {first_item['message'].keys()}")
-                # Handle nested message structure
-                if 'content' in first_item['message']:
-                    message = first_item['message']['content']
-                    print(f"DEBUG: Found 'content' in message: {message[:100]}...")
-                # Check if time is inside message object
-                if 'time' in first_item['message']:
-                    time = first_item['message']['time']
-                    print(f"DEBUG: Found 'time' in message: {time}")
-                # Check if title is inside message object
-                if 'title' in first_item['message']:
-                    title = first_item['message']['title']
-                    print(f"DEBUG: Found 'title' in message: {title}")
-                # Check if sentence data is inside message object
-                if 'sentence' in first_item['message']:
-                    try:
-                        sentence_data = json.loads(first_item['message']['sentence'])
-                        print(f"DEBUG: Found 'sentence' data with {len(sentence_data)} items")
-                    except (json.JSONDecodeError, TypeError) as e:
-                        print(f"DEBUG: Error parsing sentence data: {e}")
-                        sentence_data = []
-            elif isinstance(first_item['message'], str):
-                message = first_item['message']
-                print(f"DEBUG: 'message' is a string: {message[:100]}...")
-        else:
-            print(f"DEBUG: No 'message' key found in first_item")
+        # ?format=html returns the page a PDF would be rendered from, for
+        # previews; css=link points at /static/notes.css instead of inlining
+        output_format = request.args.get('format', 'pdf').lower()
+        css = request.args.get('css', 'inline').lower()
+        # ?profile=fast trades PDF size for render time
+        profile = request.args.get('profile', PDF_PROFILE).lower()
+        if output_format not in ('pdf', 'html'):
+            return jsonify({'error': 'format must be pdf or html'}), 400
+        if css not in PREVIEW_CSS_MODES:
+            return jsonify({'error': f"css must be one of {', '.join(PREVIEW_CSS_MODES)}"}), 400
+        if profile not in PDF_PROFILES:
+            return jsonify({'error': f"profile must be one of {', '.join(PDF_PROFILES)}"}), 400
         
-        # Get title and time from first item
-        print(f"DEBUG: Before fallback - Title: {title}, Time: {time}")
+        documents = normalize(data, merge)
         
-        # If title wasn't found in message, try root level
-        if not title:
-            title = first_item.get("title", "No Title")
-            print(f"DEBUG: Title not found in message, using root level: {title}")
-        # If time wasn't found in message, try root level
-        if not time:
-            time = first_item.get("time", "")
-            print(f"DEBUG: Time not found in message, using root level: {time}")
+        if output_format == 'html':
+            return html_preview(documents, merge, css)
         
-        print(f"DEBUG: Final values - Title: '{title}', Time: '{time}', Sentence data items: {len(sentence_data)}")
+        # Identical documents render identical PDFs, so the digest is the ETag
+        digest = documents_digest(documents, merge, profile_variant(profile))
+        if request.if_none_match.contains(digest):
+            return content_address(Response(status=304), digest)
         
-    elif isinstance(data, dict):
-        # Handle dictionary format
-        if 'output' in data:
-            items = data['output']
-        elif 'data' in data:
-            items = data['data']
-        elif 'words' in data:
-            items = data['words']
-        else:
-            items = [data]
+        pdf_bytes, pdf_path = pdf_cache.get(digest)
+        if pdf_path is not None:
+            # Disk hit: nginx or the WSGI server sends the file with sendfile
+            response = send_pdf_file(pdf_path, digest)
+            response.headers['X-Cache'] = 'HIT-DISK'
+            return content_address(response, digest)
         
-        # Get message if available
-        message = ''
-        title = None
-        time = None
-        sentence_data = []
+        cache_status = 'HIT'
+        pdf_file = None
+        if pdf_bytes is None:
+            cache_status = 'MISS'
+            
+            pdf_bytes, pdf_file = render_and_cache(documents, digest, merge, profile)
         
-        print(f"DEBUG: Processing dict data with keys: {data.keys()}")
+        if pdf_file is not None and PDF_ACCEL_REDIRECT:
+            cached_path = pdf_cache.disk.path(digest)
+            if os.path.exists(cached_path):
+                # Spooled into the disk cache; slow clients tie up nginx
+                # instead of an app worker
+                pdf_file.close()
+                response = send_pdf_file(cached_path, digest)
+                response.headers['X-Cache'] = cache_status
+                return content_address(response, digest)
         
-        if 'message' in data:
-            print(f"DEBUG: Found 'message' key in data")
-            if isinstance(data['message'], dict):
-                print(f"DEBUG: 'message' is a dict with keys: {data['message'].keys()}")
-                # Handle nested message structure
-                if 'content' in data['message']:
-                    message = data['message']['content']
-                    print(f"DEBUG: Found 'content' in message: {message[:100]}...")
-                # Check if time is inside message object
-                if 'time' in data['message']:
-                    time = data['message']['time']
-                    print(f"DEBUG: Found 'time' in message: {time}")
-                # Check if title is inside message object
-                if 'title' in data['message']:
-                    title = data['message']['title']
-                    print(f"DEBUG: Found 'title' in message: {title}")
-                # Check if sentence data is inside message object
-                if 'sentence' in data['message']:
-                    try:
-                        sentence_data = json.loads(data['message']['sentence'])
-                        print(f"DEBUG: Found 'sentence' data with {len(sentence_data)} items")
-                    except (json.JSONDecodeError, TypeError) as e:
-                        print(f"DEBUG: Error parsing sentence data: {e}")
-                        sentence_data = []
-            elif isinstance(data['message'], str):
-                message = data['message']
-                print(f"DEBUG: 'message' is a string: {message[:100]}...")
+        if pdf_file is not None:
+            # Large PDFs were spooled to disk; stream them in chunks
+            body = iter_file(pdf_file)
+            size = os.fstat(pdf_file.fileno()).st_size
         else:
-            print(f"DEBUG: No 'message' key found in data")
+            body = pdf_bytes
+            size = len(pdf_bytes)
         
-        # Get title and time
-        print(f"DEBUG: Before fallback - Title: {title}, Time: {time}")
+        # Return PDF as response
+        response = Response(
+            body,
+            mimetype='application/pdf',
+            headers={
+                'Content-Disposition': 'attachment; filename=english_learning_notes.pdf',
+                'Content-Length': size,
+                'X-Cache': cache_status
+            }
+        )
         
-        # If title wasn't found in message, try root level
-        if not title:
-            title = data.get("title", "No Title")
-            print(f"DEBUG: Title not found in message, using root level: {title}")
-        # If time wasn't found in message, try root level
-        if not time:
-            time = data.get("time", "")
-            print(f"DEBUG: Time not found in message, using root level: {time}")
+        return content_address(response, digest)
         
-        print(f"DEBUG: Final values - Title: '{title}', Time: '{time}', Sentence data items: {len(sentence_data)}")
-    else:
-        items = [data]
-        message = ''
-        title = "No Title"
-        time = ""
-        sentence_data = []
-
-    # Convert time from GMT to GMT+6
-    current_time = ''
-    if time:
-        try:
-            dt = datetime.fromisoformat(time.replace('Z', '+00:00'))
-            gmt6 = pytz.timezone('Asia/Dhaka')
-            local_time = dt.astimezone(gmt6)
-            current_time = local_time.strftime('%Y-%m-%d %H:%M:%S GMT+6')
-        except Exception:
-            current_time = 'Time conversion error'
-    else:
-        # Use current time in GMT+6 if no time provided
-        gmt6 = pytz.timezone('Asia/Dhaka')
-        current_time = datetime.now(gmt6).strftime('%Y-%m-%d %H:%M:%S GMT+6')
+    except PayloadError as e:
+        return jsonify({'error': f'Invalid payload: {e}', 'path': e.path}), 422
+    except HTTPException:
+        # Body limit and malformed JSON are answered by their error handlers
+        raise
+    except RenderPoolBusy as e:
+        app.logger.warning('Rejecting render: %s, retry after %ss', e, e.retry_after)
+        response = jsonify({'error': 'Server is busy, please retry later',
+                            'retry_after': e.retry_after})
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response, 503
+    except Exception as e:
+        app.logger.exception('PDF generation failed')
+        return jsonify({'error': f'Error generating PDF: {str(e)}'}), 500
+
+@app.route('/convert-to-pdf/batch', methods=['POST'])
+def convert_batch_to_pdf():
+    """Render a list of documents concurrently and stream them back as a ZIP"""
+    if not request.is_json:
+        return jsonify({'error': 'Content-Type must be application/json'}), 400
     
-    html_content = """
-    <!DOCTYPE html>
-    <html lang="en">
-    <head>
-        <meta charset="UTF-8">
-        <meta name="viewport" content="width=device-width, initial-scale=1.0">
-        <title>AI Powered English Learning Notes - {title}</title>
-        <style>
-            @import url('https://fonts.googleapis.com/css2?family=Noto+Sans+Bengali:wght@400;500;700&display=swap');
-            
-            @page {
-                size: A4 portrait;
-                margin: 10mm;
-            }
-            
-            body {
-                font-family: 'Arial', 'Noto Sans Bengali', sans-serif;
-                margin: 0;
-                padding: 15px;
-                background-color: white;
-                color: #333;
-                line-height: 1.4;
-                font-size: 20px; /* Increased base font size for body text */
-            }
-            
-            .header {
-                text-align: center;
-                margin-bottom: 20px;
-                border-bottom: 3px solid #2c3e50;
-                padding-bottom: 15px;
-            }
-            
-            .main-title {
-                font-size: 28px; /* Increased for larger main title */
-                font-weight: bold;
-                color: #2c3e50;
-                margin-bottom: 8px;
-            }
-            
-            .news-title {
-                font-size: 24px; /* Increased for larger news title */
-                font-weight: bold;
-                color: #e74c3c;
-                margin-bottom: 8px;
-                text-align: center;
-            }
-            
-            .time-info {
-                font-size: 16px; /* Increased for better readability */
-                color: #7f8c8d;
-                text-align: center;
-                margin-bottom: 15px;
-            }
-            
-            .section {
-                margin-bottom: 22px;
-                page-break-inside: avoid;
-            }
-            
-            .section-title {
-                font-size: 18px; /* Increased for section titles */
-                font-weight: bold;
-                color: #2c3e50;
-                margin-bottom: 12px;
-                border-bottom: 2px solid #3498db;
-                padding-bottom: 5px;
-            }
-            
-            .table-container {
-                width: 100%;
-                overflow-x: auto;
-            }
-            
-            table {
-                width: 100%;
-                border-collapse: collapse;
-                margin-bottom: 20px;
-            }
-            
-            th, td {
-                border: 1px solid #ddd;
-                padding: 8px; /* Increased padding for better spacing */
-                text-align: left;
-                font-size: 16px; /* Increased for table content */
-                vertical-align: middle;
-            }
-            
-            th {
-                background-color: #3498db;
-                color: white;
-                font-weight: bold;
-            }
-            
-            tr:nth-child(even) {
-                background-color: #f2f2f2;
-            }
-            
-            .bengali-text {
-                font-family: 'Noto Sans Bengali', 'Arial', sans-serif;
-                text-align: left;
-                font-size: 16px; /* Explicitly set for Bengali text */
-            }
-            
-            .synonyms, .antonyms {
-                font-size: 16px; /* Increased for synonyms/antonyms */
-                text-align: left;
-            }
-            
-            .synonyms {
-                color: #27ae60;
-            }
-            
-            .antonyms {
-                color: #e74c3c;
-            }
-            
-            .translation-section {
-                margin-top: 20px;
-            }
-            
-            .translation-content {
-                background-color: #f8f9fa;
-                padding: 12px;
-                border-radius: 8px;
-                border-left: 4px solid #3498db;
-                font-size: 20px; /* Increased for translation text */
-                line-height: 1.6;
-                text-align: justify;
-            }
-            
-            .english-text {
-                font-size: 20px;
-            }
-            
-            .bengali-translation {
-                font-family: 'Noto Sans Bengali', 'Arial', sans-serif;
-                direction: rtl;
-                text-align: right;
-                margin-top: 10px;
-                padding-top: 10px;
-                border-top: 1px solid #ddd;
-                font-size: 14px; /* Explicitly set for Bengali translation */
-            }
-            
-            .sentence-example {
-                background-color: #f0f8ff;
-                padding: 8px;
-                border-radius: 4px;
-                margin: 4px 0;
-                font-size: 14px;
-                line-height: 1.4;
-            }
-            
-            .sentence-example-en {
-                color: #2c3e50;
-                font-weight: 500;
-            }
-            
-            .sentence-example-bn {
-                color: #7f8c8d;
-                font-style: italic;
-            }
-            
-            .footer {
-                text-align: center;
-                margin-top: 20px;
-                padding-top: 15px;
-                border-top: 1px solid #e0e0e0;
-                color: #7f8c8d;
-                font-size: 13px; /* Increased for footer */
-            }
-        </style>
-    </head>
-    <body>
-    """
+    documents = read_json_body()
+    if isinstance(documents, dict):
+        documents = documents.get('documents')
     
-    # Add vocabulary table section
-    html_content += f"""
-            <div class="header">
-            <div class="main-title">AI Powered English Learning Notes from contemporary news</div>
-            <div class="news-title">{title}</div>
-            <div class="time-info">{current_time}</div>
-        </div>
-        <div class="section">
-            <div class="section-title">Vocabulary Table</div>
-            <div class="table-container">
-                <table>
-                    <thead>
-                        <tr>
-                            <th>S/N</th>
-                            <th>Word</th>
-                            <th>Meaning in Bengali</th>
-                            <th>Synonyms</th>
-                            <th>Antonyms</th>
-                        </tr>
-                    </thead>
-                    <tbody>
-    """
+    if not isinstance(documents, list) or not documents:
+        return jsonify({'error': 'Expected a non-empty JSON list of documents'}), 400
+    if len(documents) > BATCH_MAX_DOCUMENTS:
+        return jsonify({'error': f'At most {BATCH_MAX_DOCUMENTS} documents per batch'}), 413
+    profile = request.args.get('profile', PDF_PROFILE).lower()
+    if profile not in PDF_PROFILES:
+        return jsonify({'error': f"profile must be one of {', '.join(PDF_PROFILES)}"}), 400
     
-    for i, item in enumerate(items, 1):
-        if isinstance(item, dict):
-            english = item.get('english', '')
-            bengali = item.get('bengali', '')
-            synonyms = item.get('synonyms', [])
-            antonyms = item.get('antonyms', [])
-            
-            html_content += f"""
-                        <tr>
-                            <td>{i}</td>
-                            <td><strong>{english}</strong></td>
-                            <td class="bengali-text">{bengali}</td>
-                            <td class="synonyms">{', '.join(synonyms)}</td>
-                            <td class="antonyms">{', '.join(antonyms)}</td>
-                        </tr>
-            """
+    width = len(str(len(documents)))
     
-    html_content += """
-                    </tbody>
-                </table>
-            </div>
-        </div>
-    """
+    def entries():
+        # Each PDF is added to the archive as soon as it is rendered
+        errors = []
+        window = max(batch_pool.size, 1)
+        # Like jobs, batch documents wait for a render slot instead of
+        # ending up in errors.json when the server is busy
+        submit = lambda data: submit_admitted(
+            lambda: submit_payload(data, profile, batch_pool), batch_pool.timeout
+        )
+        for index, future in iter_completed(documents, submit, window):
+            try:
+                pdf_bytes = future.result()
+            except Exception as e:
+                errors.append({'index': index, 'error': str(e)})
+                continue
+            yield f'english_learning_notes_{index + 1:0{width}d}.pdf', pdf_bytes
+        if errors:
+            yield 'errors.json', json.dumps(errors, indent=2).encode('utf-8')
     
-    # Add sentence examples table if sentence data exists
-    if sentence_data:
-        html_content += """
-        <div class="section">
-            <div class="section-title">Sentence Examples with Context</div>
-            <div class="table-container">
-                <table>
-                    <thead>
-                        <tr>
-                            <th>S/N</th>
-                            <th>Word</th>
-                            <th>Meaning in Bengali</th>
-                            <th>Example Sentence (English)</th>
-                            <th>Example Sentence (Bengali)</th>
-                        </tr>
-                    </thead>
-                    <tbody>
-        """
-        
-        for i, sentence_item in enumerate(sentence_data, 1):
-            if isinstance(sentence_item, dict):
-                word = sentence_item.get('word', '')
-                meaning_bn = sentence_item.get('meaning_bn', '')
-                example_en = sentence_item.get('example_en', '')
-                example_bn = sentence_item.get('example_bn', '')
-                
-                html_content += f"""
-                        <tr>
-                            <td>{i}</td>
-                            <td><strong>{word}</strong></td>
-                            <td class="bengali-text">{meaning_bn}</td>
-                            <td class="sentence-example sentence-example-en">{example_en}</td>
-                            <td class="bengali-text sentence-example sentence-example-bn">{example_bn}</td>
-                        </tr>
-                """
-        
-        html_content += """
-                    </tbody>
-                </table>
-            </div>
-        </div>
-        """
+    return Response(
+        iter_zip(entries()),
+        mimetype='application/zip',
+        headers={
+            'Content-Disposition': 'attachment; filename=english_learning_notes.zip',
+            # Let nginx pass entries through instead of buffering the archive
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
+@app.route('/jobs', methods=['POST'])
+def create_job():
+    """Queue a PDF render and return immediately with the job id"""
+    if not request.is_json:
+        return jsonify({'error': 'Content-Type must be application/json'}), 400
     
-    # Add translation section if message exists
-    if message:
-        html_content += f"""
-        <div class="section translation-section">
-            <div class="section-title">English-Bengali Phrase by Phrase Translation</div>
-            <div class="translation-content">
-                <div class="english-text">{message}</div>
-            </div>
-        </div>
-        """
+    data = read_json_body()
     
-    html_content += """
-        <div class="footer">
-            Generated by EnglishKaku  AI powered Workflow
-        </div>
-    </body>
-    </html>
-    """
+    if not data:
+        return jsonify({'error': 'No JSON data provided'}), 400
+    
+    try:
+        documents = normalize(data)
+    except PayloadError as e:
+        return jsonify({'error': f'Invalid payload: {e}', 'path': e.path}), 422
     
-    return html_content
+    job = job_manager.submit(documents)
+    status_url = url_for('get_job', job_id=job['id'])
+    response = jsonify({
+        'job_id': job['id'],
+        'status': job['status'],
+        'status_url': status_url,
+        'result_url': url_for('get_job_result', job_id=job['id'])
+    })
+    response.status_code = 202
+    response.headers['Location'] = status_url
+    return response
 
-@app.route('/convert-to-pdf', methods=['POST'])
-def convert_to_pdf():
-    """Convert JSON content to PDF and return as response"""
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Report the status of a render job"""
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found or expired'}), 404
+    return jsonify({
+        'job_id': job['id'],
+        'status': job['status'],
+        'error': job.get('error'),
+        'result_url': url_for('get_job_result', job_id=job['id'])
+    })
+
+@app.route('/jobs/<job_id>/result', methods=['GET'])
+def get_job_result(job_id):
+    """Download the PDF of a finished render job"""
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found or expired'}), 404
+    if job['status'] == 'failed':
+        return jsonify({'error': f"Error generating PDF: {job.get('error')}"}), 500
+    if job['status'] != 'done':
+        return jsonify({'job_id': job['id'], 'status': job['status']}), 202
+    result_path = job_manager.result_path(job['id'])
+    if not os.path.exists(result_path):
+        return jsonify({'error': 'Job not found or expired'}), 404
     try:
-        # Get JSON data from request
-        if not request.is_json:
-            return jsonify({'error': 'Content-Type must be application/json'}), 400
-        
-        data = request.get_json()
-        
-        if not data:
-            return jsonify({'error': 'No JSON data provided'}), 400
-        
-        # Convert JSON to HTML
-        html_content = convert_json_to_html(data)
-        
-        # Create PDF using WeasyPrint
-        font_config = FontConfiguration()
-        
-        # Create HTML object
-        html_doc = HTML(string=html_content)
-        
-        # Generate PDF with landscape orientation
-        pdf_bytes = html_doc.write_pdf(
-            stylesheets=[],
-            font_config=font_config
+        return send_pdf_file(result_path)
+    except FileNotFoundError:
+        return jsonify({'error': 'Job not found or expired'}), 404
+
+@app.route('/pdf/<digest>', methods=['GET'])
+def get_pdf(digest):
+    """Serve a rendered PDF by the digest a POST returned; HEAD works too"""
+    if not DIGEST_PATTERN.fullmatch(digest):
+        return jsonify({'error': 'PDF not found'}), 404
+    cache_control = f'public, max-age={PDF_IMMUTABLE_MAX_AGE}, immutable'
+    if request.if_none_match.contains(digest):
+        response = Response(status=304, headers={'Cache-Control': cache_control})
+        response.set_etag(digest)
+        return response
+    
+    pdf_bytes, pdf_path = pdf_cache.get(digest)
+    if pdf_path is not None:
+        # Sent by the app even with PDF_ACCEL_REDIRECT: nginx only caches
+        # responses that carry the body, and its proxy_cache reads them
+        # from the app at full speed anyway
+        response = send_file(
+            pdf_path,
+            mimetype='application/pdf',
+            as_attachment=True,
+            download_name='english_learning_notes.pdf',
+            etag=digest,
+            conditional=True
         )
-        
-        # Return PDF as response
+        response.headers['X-Cache'] = 'HIT-DISK'
+    elif pdf_bytes is not None:
         response = Response(
             pdf_bytes,
             mimetype='application/pdf',
             headers={
                 'Content-Disposition': 'attachment; filename=english_learning_notes.pdf',
-                'Content-Length': len(pdf_bytes)
+                'X-Cache': 'HIT'
             }
         )
-        
-        return response
-        
-    except Exception as e:
-        return jsonify({'error': f'Error generating PDF: {str(e)}'}), 500
+        response.set_etag(digest)
+    else:
+        # Evicted or never rendered; the client has to POST the payload again
+        return jsonify({'error': 'PDF not found or expired, POST the payload to /convert-to-pdf'}), 404
+    response.headers['Cache-Control'] = cache_control
+    return response
 
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
-    return jsonify({'status': 'healthy', 'message': 'API is running'})
+    return jsonify({
+        'status': 'healthy',
+        'message': 'API is running',
+        'cache': pdf_cache.stats(),
+        'html_cache': html_cache.stats()
+    })
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus text exposition of request, render and cache metrics"""
+    return Response(
+        metrics.render_metrics(),
+        mimetype='text/plain; version=0.0.4'
+    )
 
 @app.route('/', methods=['GET'])
 def home():
@@ -517,27 +605,66 @@ def home():
             'endpoint': '/convert-to-pdf',
             'method': 'POST',
             'content_type': 'application/json',
-            'body_format': 'JSON with title, time, message, and output fields'
+            'body_format': 'JSON with title, time, message, and output fields',
+            'merge': 'POST /convert-to-pdf?merge=1 with a JSON list renders every item into one PDF',
+            'preview': 'POST /convert-to-pdf?format=html returns the page as HTML (css=inline or css=link)',
+            'profile': 'POST /convert-to-pdf?profile=fast renders quicker but larger PDFs',
+            'download': 'GET /pdf/<digest> (the Location of a previous response) serves the same PDF, cacheable'
         },
-        'example': {
-            'title': 'News Title',
-            'time': '2025-08-29T01:57:50.782-04:00',
-            'message': {
-                'content': 'News content...',
-                'title': 'News Title',
-                'time': '2025-08-29T01:57:50.782-04:00',
-                'sentence': '[{"word":"example","meaning_bn":"উদাহরণ","example_en":"This is an example sentence.","example_bn":"এটি একটি উদাহরণ বাক্য।"}]'
-            },
-            'output': [
-                {
-                    'english': 'word',
-                    'bengali': 'শব্দ',
-                    'synonyms': ['synonym1', 'synonym2'],
-                    'antonyms': ['antonym1', 'antonym2']
-                }
-            ]
-        }
+        'async_usage': {
+            'submit': 'POST /jobs (same body, returns 202 with a job id)',
+            'status': 'GET /jobs/<job_id>',
+            'result': 'GET /jobs/<job_id>/result'
+        },
+        'example': EXAMPLE_PAYLOAD
     })
 
+def warm_up():
+    """Render the example payload through the full pipeline once.
+
+    With a render pool, one render per pool worker is submitted so each
+    of them is likely to be warmed. Returns True on success.
+    """
+    start = time.perf_counter()
+    try:
+        html_content = build_html(normalize(EXAMPLE_PAYLOAD))
+        renders = [render_pool.submit(html_content) for _ in range(max(render_pool.size, 1))]
+        for render in renders:
+            pdf_bytes, pdf_path = render.result(timeout=render_pool.timeout)
+            if pdf_path is not None:
+                os.remove(pdf_path)
+    except Exception as e:
+        app.logger.exception('Warm-up render failed')
+        warmup.update(pid=None, error=str(e))
+        return False
+    duration_ms = round((time.perf_counter() - start) * 1000, 2)
+    warmup.update(pid=os.getpid(), error=None, duration_ms=duration_ms)
+    app.logger.info('Warm-up render finished', extra={'duration_ms': duration_ms})
+    return True
+
+@app.route('/ready', methods=['GET'])
+def ready_check():
+    """Readiness endpoint: 200 only once this process finished its warm-up render"""
+    if warmup['pid'] == os.getpid():
+        return jsonify({'status': 'ready', 'warmup_ms': warmup['duration_ms']})
+    status = 'failed' if warmup['error'] else 'warming'
+    return jsonify({'status': status, 'error': warmup['error']}), 503
+
+def create_app():
+    """Return the application after a warm-up render.
+
+    This is the production entry point (``gunicorn 'app:create_app()'``,
+    see gunicorn.conf.py). With preload_app the master calls it once, so
+    WeasyPrint, the fonts and its lazily imported modules are loaded
+    before the workers fork; each worker then repeats the warm-up for its
+    own render context before it accepts requests.
+    """
+    warm_up()
+    return app
+
 if __name__ == '__main__':
+    # Development server only; production runs under gunicorn. The
+    # reloader's parent process never serves, so only its child warms up.
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        create_app()
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
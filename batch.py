@@ -0,0 +1,78 @@
+"""Streaming ZIP archives for batch renders.
+
+Entries are written to the client as soon as each PDF is ready, so the
+archive is never held in memory as a whole.
+"""
+
+import os
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, wait
+
+BATCH_MAX_DOCUMENTS = int(os.environ.get('BATCH_MAX_DOCUMENTS', 500))
+# Processes of a separate pool for batch documents, used when the main
+# render pool renders in-process (RENDER_POOL_SIZE=0, as under gunicorn);
+# 0 renders batches through the main pool
+BATCH_POOL_SIZE = int(os.environ.get('BATCH_POOL_SIZE', 0))
+
+
+class _ZipStream:
+    """Write-only, non-seekable sink that hands out what was written so far.
+
+    Because it cannot seek, ZipFile writes each entry's sizes in a trailing
+    data descriptor instead of patching the local header afterwards.
+    """
+
+    def __init__(self):
+        self._chunks = []
+        self._offset = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._offset += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._offset
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def iter_zip(entries):
+    """Yield a ZIP archive chunk by chunk from an iterable of (name, bytes)"""
+    stream = _ZipStream()
+    # PDF streams are already compressed, so entries are stored as-is
+    with zipfile.ZipFile(stream, 'w', zipfile.ZIP_STORED) as archive:
+        for name, data in entries:
+            archive.writestr(name, data)
+            yield stream.pop()
+    yield stream.pop()
+
+
+def iter_completed(items, submit, window):
+    """Submit items with at most ``window`` in flight and yield
+    ``(index, future)`` pairs in completion order.
+
+    ``submit`` takes an item and returns a Future.
+    """
+    pending = {}
+    items = iter(enumerate(items))
+    exhausted = False
+    while pending or not exhausted:
+        while not exhausted and len(pending) < window:
+            try:
+                index, item = next(items)
+            except StopIteration:
+                exhausted = True
+                break
+            pending[submit(item)] = index
+        if not pending:
+            break
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            yield pending.pop(future), future
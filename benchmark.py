@@ -0,0 +1,385 @@
+#!/usr/bin/env python3
+"""
+Offline benchmarks for the PDF pipeline; nothing here talks to a server.
+
+    python benchmark.py                 normalization and HTML build by size
+    python benchmark.py memory          bytes vs SpoolFile serialization peak
+    python benchmark.py scaling         render time from 100 to 20,000 rows
+    python benchmark.py profiles        render time vs PDF size per output profile
+    python benchmark.py suite           every stage over the payload matrix
+    python benchmark.py suite --save baseline.json
+    python benchmark.py suite --compare baseline.json
+
+The suite times normalization, HTML build, layout and PDF write separately
+for English and Bengali-heavy payloads of several sizes, and records the
+tracemalloc peak of a full run. ``--save`` writes the results as a JSON
+baseline; ``--compare`` prints the change against one and exits with status
+1 when a stage got slower or bigger than ``--threshold``. Layout and write
+need WeasyPrint and its system libraries; ``--no-render`` skips them.
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import normalize
+from normalize import normalize_payload
+from notes_template import LARGE_DOCUMENT_ROWS, TEMPLATE_VERSION, documents_to_html
+
+ROW_COUNTS = [10, 1000, 50000]
+MEMORY_ROW_COUNTS = [1000, 5000]
+SCALING_ROW_COUNTS = [100, 500, 1000, 2000, 5000, 10000, 20000]
+# Single-table renders get slow quickly; stop comparing above this
+SCALING_COMPARE_MAX_ROWS = 5000
+PROFILE_CASES = [('english', 50), ('bengali', 50), ('bengali', 1000)]
+SUITE_ROW_COUNTS = [10, 100, 1000, 5000]
+SUITE_KINDS = ['english', 'bengali']
+SUITE_STAGES = ['normalize', 'html', 'layout', 'write']
+# Regressions smaller than this are treated as noise
+REGRESSION_MIN_MS = 1.0
+
+# The request limit guards the server; the benchmark measures beyond it
+normalize.MAX_VOCABULARY_ROWS = max(normalize.MAX_VOCABULARY_ROWS, *ROW_COUNTS)
+
+BENGALI_PARAGRAPH = (
+    'ঢাকার প্রেস ক্লাবের সামনে বিরোধ তীব্রতর হয়, এবং পুলিশ পরিস্থিতি নিয়ন্ত্রণে আনতে '
+    'হস্তক্ষেপ করে। প্রত্যক্ষদর্শীরা জানান, সমাবেশটি শান্তিপূর্ণভাবে শুরু হয়েছিল। '
+)
+
+
+def make_payload(rows, sentence_as_list=False, bengali=False):
+    """Build a payload with the given number of vocabulary rows.
+
+    One sentence row is added per ten vocabulary rows, sent either as a
+    JSON-encoded string (what clients send today) or as a native array.
+    A Bengali-heavy payload has long Bengali meanings, examples and
+    message text, which is the expensive case for shaping and font
+    subsetting.
+    """
+    meaning = BENGALI_PARAGRAPH[:60] if bengali else 'অর্থ'
+    example_bn = BENGALI_PARAGRAPH if bengali else 'প্রেস ক্লাবের কাছে বিরোধ তীব্রতর হয়।'
+    sentences = [
+        {
+            'word': f'word{i}',
+            'meaning_bn': meaning,
+            'example_en': 'The altercation escalated near the press club.',
+            'example_bn': example_bn,
+        }
+        for i in range(max(rows // 10, 1))
+    ]
+    if bengali:
+        content = BENGALI_PARAGRAPH * max(rows // 10, 20)
+    else:
+        content = 'The altercation (বিরোধ) escalated (তীব্রতর হয়) near the press club. ' * 20
+    return {
+        'title': 'Benchmark document',
+        'time': '2025-08-29T10:55:30.742-04:00',
+        'message': {
+            'content': content,
+            'sentence': sentences if sentence_as_list else json.dumps(sentences, ensure_ascii=False),
+        },
+        'output': [
+            {
+                'english': f'word{i}',
+                'bengali': meaning if bengali else 'শব্দ',
+                'synonyms': ['synonym1', 'synonym2'],
+                'antonyms': ['antonym1', 'antonym2'],
+            }
+            for i in range(rows)
+        ],
+    }
+
+
+def best_time(func, arg, repeat):
+    """Return the best wall time in seconds of func(arg) over repeat calls"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(arg)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def time_html_build(payload, repeat):
+    """Return the best wall time in seconds over repeat builds"""
+    return best_time(lambda data: documents_to_html(normalize_payload(data)), payload, repeat)
+
+
+def run_normalize_benchmark():
+    """Print normalization time for each size, sentences as string and as list"""
+    print("Payload normalization (best of N)")
+    print("=" * 50)
+    for rows in ROW_COUNTS:
+        repeat = 20 if rows <= 1000 else 3
+        as_string = best_time(normalize_payload, make_payload(rows), repeat)
+        as_list = best_time(normalize_payload, make_payload(rows, sentence_as_list=True), repeat)
+        print(f"{rows:>8} rows: {as_string * 1000:10.2f} ms string sentences, "
+              f"{as_list * 1000:10.2f} ms list sentences  ({as_list / rows * 1e6:.2f} us/row)")
+
+
+def run_html_benchmark():
+    """Print HTML-build time for each vocabulary size"""
+    print("HTML build time, including normalization (best of N)")
+    print("=" * 50)
+    for rows in ROW_COUNTS:
+        repeat = 20 if rows <= 1000 else 3
+        seconds = time_html_build(make_payload(rows), repeat)
+        print(f"{rows:>8} rows: {seconds * 1000:10.2f} ms  ({seconds / rows * 1e6:.2f} us/row)")
+
+
+def traced_peak(func):
+    """Return the peak of traced allocations in bytes while func runs"""
+    tracemalloc.reset_peak()
+    baseline = tracemalloc.get_traced_memory()[0]
+    func()
+    return tracemalloc.get_traced_memory()[1] - baseline
+
+
+def run_memory_benchmark():
+    """Print the peak memory of PDF serialization, as bytes and spooled"""
+    from pdf_output import SpoolFile, iter_file
+    from render_context import get_render_context
+
+    context = get_render_context()
+    spool_dir = tempfile.mkdtemp(prefix='spool-benchmark-')
+    print("PDF serialization peak memory (tracemalloc)")
+    print("=" * 50)
+    tracemalloc.start()
+    for rows in MEMORY_ROW_COUNTS:
+        html = documents_to_html(normalize_payload(make_payload(rows)))
+        # Layout happens first so only serialization is measured
+        document = context.layout(html)
+        result = {}
+
+        def as_bytes():
+            result['size'] = len(document.write_pdf())
+
+        def as_spool():
+            spool = SpoolFile(directory=spool_dir)
+            document.write_pdf(spool)
+            pdf_bytes, path = spool.finish()
+            if path is not None:
+                for _ in iter_file(open(path, 'rb')):
+                    pass
+                os.remove(path)
+
+        bytes_peak = traced_peak(as_bytes)
+        spool_peak = traced_peak(as_spool)
+        print(f"{rows:>8} rows, {result['size'] / 1e6:6.2f} MB PDF: "
+              f"{bytes_peak / 1e6:8.2f} MB as bytes, {spool_peak / 1e6:8.2f} MB spooled")
+    tracemalloc.stop()
+    os.rmdir(spool_dir)
+
+
+def time_render(context, html):
+    """Return (layout, write) seconds for one render of html"""
+    _, stats = context.render_pdf(html)
+    return stats['layout'], stats['write']
+
+
+def run_scaling_benchmark():
+    """Print render time per size, in large-document mode and as single tables"""
+    from render_context import get_render_context
+
+    context = get_render_context()
+    # Warm up fonts and stylesheets so the first size is not penalized
+    context.render_pdf(documents_to_html(normalize_payload(make_payload(10))))
+    print(f"Render time, large-document mode above {LARGE_DOCUMENT_ROWS} rows")
+    print("=" * 50)
+    for rows in SCALING_ROW_COUNTS:
+        documents = normalize_payload(make_payload(rows))
+        layout, write = time_render(context, documents_to_html(documents))
+        line = (f"{rows:>8} rows: {(layout + write) * 1000:10.0f} ms "
+                f"(layout {layout * 1000:.0f}, write {write * 1000:.0f}, "
+                f"{(layout + write) / rows * 1e6:.0f} us/row)")
+        if LARGE_DOCUMENT_ROWS < rows <= SCALING_COMPARE_MAX_ROWS:
+            single = sum(time_render(context, documents_to_html(documents, large_rows=rows)))
+            line += f"  single table {single * 1000:.0f} ms"
+        print(line)
+
+
+def run_profile_benchmark():
+    """Print render time and PDF size for each output profile"""
+    from render_context import PDF_PROFILES, get_render_context
+
+    context = get_render_context()
+    context.render_pdf(documents_to_html(normalize_payload(make_payload(10))))
+    print("Output profiles: render time vs PDF size (median of 3)")
+    print("=" * 50)
+    for kind, rows in PROFILE_CASES:
+        html = documents_to_html(normalize_payload(make_payload(rows, bengali=kind == 'bengali')))
+        results = {}
+        for profile in PDF_PROFILES:
+            runs = [context.render_pdf(html, profile=profile)[1] for _ in range(3)]
+            results[profile] = (
+                statistics.median(stats['layout'] for stats in runs),
+                statistics.median(stats['write'] for stats in runs),
+                runs[-1]['bytes'],
+            )
+        default_size = results['default'][2]
+        for profile, (layout, write, size) in results.items():
+            line = (f"{kind:>8} {rows:>5} rows {profile:>8}: layout {layout * 1000:7.0f} ms, "
+                    f"write {write * 1000:7.0f} ms, {size / 1024:8.1f} KB "
+                    f"({size / default_size:.2f}x default)")
+            if profile != 'default' and size == default_size:
+                line += "  same size as default: no effect on this template"
+            print(line)
+
+
+def median_time(func, repeat):
+    """Return (median seconds, last result) of func() over repeat calls"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times), result
+
+
+def run_case(kind, rows, context):
+    """Time each stage for one payload and return the result record"""
+    payload = make_payload(rows, bengali=kind == 'bengali')
+    repeat = 11 if rows <= 1000 else 3
+    record = {'kind': kind, 'rows': rows}
+    seconds, documents = median_time(lambda: normalize_payload(payload), repeat)
+    record['normalize_ms'] = seconds * 1000
+    seconds, html = median_time(lambda: documents_to_html(documents), repeat)
+    record['html_ms'] = seconds * 1000
+    record['html_bytes'] = len(html.encode('utf-8'))
+    if context is not None:
+        render_repeat = 3 if rows <= 1000 else 1
+        seconds, document = median_time(lambda: context.layout(html), render_repeat)
+        record['layout_ms'] = seconds * 1000
+        record['pages'] = len(document.pages)
+        seconds, pdf_bytes = median_time(document.write_pdf, render_repeat)
+        record['write_ms'] = seconds * 1000
+        record['pdf_bytes'] = len(pdf_bytes)
+        del document, pdf_bytes
+
+    def pipeline():
+        html = documents_to_html(normalize_payload(payload))
+        if context is not None:
+            context.render_pdf(html)
+
+    # Traced separately: tracemalloc slows the timed runs down
+    tracemalloc.start()
+    record['peak_mb'] = traced_peak(pipeline) / 1e6
+    tracemalloc.stop()
+    return record
+
+
+def run_suite(render=True):
+    """Run the stage matrix and return the results with environment details"""
+    context = None
+    meta = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'template_version': TEMPLATE_VERSION,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+    }
+    if render:
+        import weasyprint
+        from render_context import get_render_context
+
+        meta['weasyprint'] = weasyprint.__version__
+        context = get_render_context()
+        # Load fonts and stylesheets before anything is timed
+        context.render_pdf(documents_to_html(normalize_payload(make_payload(10))))
+    results = {}
+    for kind in SUITE_KINDS:
+        for rows in SUITE_ROW_COUNTS:
+            record = run_case(kind, rows, context)
+            results[f'{kind}-{rows}'] = record
+            print_record(record)
+    return {'meta': meta, 'results': results}
+
+
+def print_record(record):
+    stages = '  '.join(
+        f"{stage} {record[stage + '_ms']:9.2f}" for stage in SUITE_STAGES
+        if stage + '_ms' in record
+    )
+    print(f"{record['kind']:>8} {record['rows']:>6} rows: {stages} ms  "
+          f"peak {record['peak_mb']:7.2f} MB")
+
+
+def compare_results(baseline, current, threshold):
+    """Print the change of every metric against baseline and return the
+    names of the ones that regressed by more than threshold"""
+    if baseline['meta'].get('template_version') != current['meta']['template_version']:
+        print(f"Note: baseline template version {baseline['meta'].get('template_version')}, "
+              f"current {current['meta']['template_version']}")
+    print()
+    print(f"Change against baseline from {baseline['meta'].get('created', '?')} "
+          f"(regression threshold {threshold:.0%})")
+    print("=" * 50)
+    regressions = []
+    for name, record in current['results'].items():
+        old = baseline['results'].get(name)
+        if old is None:
+            print(f"{name:>14}: not in baseline")
+            continue
+        changes = []
+        for metric in [stage + '_ms' for stage in SUITE_STAGES] + ['peak_mb']:
+            if metric not in record or not old.get(metric):
+                continue
+            change = record[metric] / old[metric] - 1
+            flag = ''
+            noise = metric.endswith('_ms') and record[metric] - old[metric] < REGRESSION_MIN_MS
+            if change > threshold and not noise:
+                flag = ' !'
+                regressions.append(f'{name} {metric}')
+            changes.append(f"{metric[:-3]} {change:+6.1%}{flag}")
+        print(f"{name:>14}: " + '  '.join(changes))
+    return regressions
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('mode', nargs='?', default='html',
+                        choices=['html', 'memory', 'scaling', 'profiles', 'suite'])
+    parser.add_argument('--save', metavar='PATH', help='write suite results as a JSON baseline')
+    parser.add_argument('--compare', metavar='PATH', help='compare suite results with a baseline')
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help='relative slowdown reported as a regression (default 0.10)')
+    parser.add_argument('--no-render', action='store_true',
+                        help='skip layout and PDF write in the suite')
+    args = parser.parse_args(argv)
+
+    if args.mode == 'memory':
+        run_memory_benchmark()
+    elif args.mode == 'scaling':
+        run_scaling_benchmark()
+    elif args.mode == 'profiles':
+        run_profile_benchmark()
+    elif args.mode == 'suite':
+        print("Pipeline stages, median of N (normalize, html, layout, write)")
+        print("=" * 50)
+        current = run_suite(render=not args.no_render)
+        if args.save:
+            with open(args.save, 'w', encoding='utf-8') as f:
+                json.dump(current, f, indent=2)
+            print(f"Saved baseline to {args.save}")
+        if args.compare:
+            with open(args.compare, encoding='utf-8') as f:
+                baseline = json.load(f)
+            regressions = compare_results(baseline, current, args.threshold)
+            if regressions:
+                print(f"{len(regressions)} regression(s): " + ', '.join(regressions))
+                return 1
+            print("No regressions")
+    else:
+        run_normalize_benchmark()
+        print()
+        run_html_benchmark()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
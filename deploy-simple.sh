@@ -65,7 +65,8 @@ cd "$PROJECT_DIR"
 # Copy project files (assuming we're running from the project directory)
 echo -e "${BLUE}Copying project files...${NC}"
 echo -e "${YELLOW}Please ensure these files are in $PROJECT_DIR:${NC}"
-echo "  - app.py"
+echo "  - app.py and the other *.py modules"
+echo "  - static/"
 echo "  - requirements.txt"
 echo "  - Dockerfile"
 echo "  - docker-compose.simple.yml"
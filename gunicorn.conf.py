@@ -0,0 +1,118 @@
+"""Gunicorn settings for the production server.
+
+The master imports the app once (preload_app) and warms the WeasyPrint
+render context before forking, so every worker starts with WeasyPrint,
+Pango and the font data already loaded and shares those pages
+copy-on-write. Workers render in-process (batch documents go to a small
+per-worker pool instead) and are recycled after a number of renders or
+once their RSS passes a threshold, because WeasyPrint and Pango memory
+creeps up over long uptimes. Each worker does a warm-up render before it
+accepts requests.
+
+Every worker keeps its own metrics, so they are shared through METRICS_DIR
+and /metrics reports the sum over all workers, see the metrics module.
+
+Start with: gunicorn 'app:create_app()'
+"""
+
+import os
+import random
+import resource
+import shutil
+import tempfile
+
+# Gunicorn workers are the render processes; a nested pool per worker would
+# oversubscribe the CPUs
+os.environ.setdefault('RENDER_POOL_SIZE', '0')
+# ...except for /convert-to-pdf/batch, which would otherwise render its
+# documents one at a time; each worker starts a small pool on its first batch.
+# That pool has its own admission limit, so a worker running a batch renders
+# up to 1 + BATCH_POOL_SIZE documents at once. WEB_CONCURRENCY defaults to
+# the CPU count for single renders; where batches are a large share of the
+# traffic, use about CPUs / (1 + BATCH_POOL_SIZE) workers instead
+os.environ.setdefault('BATCH_POOL_SIZE', '2')
+# Per-worker metric snapshots, private to this master
+os.environ.setdefault(
+    'METRICS_DIR', os.path.join(tempfile.gettempdir(), f'englishkaku-metrics-{os.getpid()}')
+)
+
+bind = os.environ.get('BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('WEB_CONCURRENCY', os.cpu_count() or 1))
+# Extra threads keep health checks, metrics and cache hits answered while
+# a worker is busy rendering
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 180))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 60))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+preload_app = True
+
+WORKER_MAX_RENDERS = int(os.environ.get('WORKER_MAX_RENDERS', 500))
+WORKER_MAX_RENDERS_JITTER = int(os.environ.get('WORKER_MAX_RENDERS_JITTER', 50))
+WORKER_MAX_RSS_MB = int(os.environ.get('WORKER_MAX_RSS_MB', 1024))
+
+
+def current_rss():
+    """Return the resident set size of this process in bytes"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        # Not Linux: fall back to the peak, reported in KiB
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def on_starting(server):
+    os.makedirs(os.environ['METRICS_DIR'], exist_ok=True)
+
+
+def on_exit(server):
+    shutil.rmtree(os.environ['METRICS_DIR'], ignore_errors=True)
+
+
+def post_fork(server, worker):
+    # Jitter keeps workers started together from recycling together
+    worker.max_renders = WORKER_MAX_RENDERS + random.randint(0, WORKER_MAX_RENDERS_JITTER)
+
+
+def post_worker_init(worker):
+    # The master's warm-up loaded the shared code and fonts; the worker's
+    # own render context still needs one render before it takes traffic
+    from app import warm_up
+    import metrics
+
+    warm_up()
+    # Counted from here, without the warm-ups of the master and this worker
+    metrics.start_worker()
+
+
+def worker_exit(server, worker):
+    import metrics
+
+    metrics.write_snapshot()
+
+
+def child_exit(server, worker):
+    import metrics
+
+    metrics.mark_process_dead(worker.pid)
+
+
+def post_request(worker, req, environ, resp):
+    from app import job_manager, render_pool
+
+    if not worker.alive:
+        return
+    reason = None
+    # Queued /jobs can only run in the worker that accepted them, so a
+    # count-based recycle waits until they are done; RSS does not wait
+    if (WORKER_MAX_RENDERS and render_pool.completed >= worker.max_renders
+            and not job_manager.pending()):
+        reason = f'{render_pool.completed} renders'
+    elif WORKER_MAX_RSS_MB and current_rss() > WORKER_MAX_RSS_MB * 1024 * 1024:
+        reason = f'RSS {current_rss() // (1024 * 1024)} MB'
+    if reason:
+        # Same mechanism as max_requests: finish in-flight requests, exit,
+        # and let the master fork a fresh worker
+        worker.log.info('Recycling worker %s after %s', worker.pid, reason)
+        worker.alive = False
@@ -0,0 +1,176 @@
+"""Asynchronous render jobs.
+
+POST /jobs hands the payload to a background executor and returns at once;
+clients poll the job status and download the PDF when it is done. Job state
+and results are files in a shared directory, so any worker process can
+answer for a job another one accepted.
+
+The work itself only lives in the accepting process, which touches the
+state files of its unfinished jobs while it runs. A queued or running job
+whose file has not been touched for JOB_STALE_AFTER seconds was lost to a
+restart or a recycled worker, and is reported as failed.
+"""
+
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from pdf_cache import PDF_FILE_MODE, PDF_SPOOL_DIR
+
+JOBS_DIR = os.environ.get('JOBS_DIR', os.path.join(PDF_SPOOL_DIR, 'jobs'))
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 4))
+JOB_RESULT_TTL = int(os.environ.get('JOB_RESULT_TTL', 3600))
+JOB_STALE_AFTER = int(os.environ.get('JOB_STALE_AFTER', 120))
+# Minimum number of seconds between two sweeps of expired jobs
+JOB_CLEANUP_INTERVAL = 60
+# Seconds between touches of the state files of unfinished jobs
+JOB_HEARTBEAT_INTERVAL = 15
+PENDING_STATUSES = ('queued', 'running')
+
+_JOB_ID_RE = re.compile(r'[0-9a-f]{32}')
+
+
+class JobManager:
+    """Runs render jobs on a thread pool and tracks them on disk.
+
+    ``render`` is called with the job payload and must return PDF bytes.
+    Finished jobs and their PDFs are removed ``ttl`` seconds after their
+    last state change.
+    """
+
+    def __init__(self, render, directory=JOBS_DIR, workers=JOB_WORKERS,
+                 ttl=JOB_RESULT_TTL, stale_after=JOB_STALE_AFTER):
+        self.render = render
+        self.directory = directory
+        self.ttl = ttl
+        self.stale_after = stale_after
+        os.makedirs(directory, exist_ok=True)
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix='render-job'
+        )
+        self._last_cleanup = 0
+        self._cleanup_lock = threading.Lock()
+        # Unfinished jobs accepted by this process, by id
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+        self._heartbeat = None
+        self._stopping = threading.Event()
+
+    def _state_path(self, job_id):
+        return os.path.join(self.directory, f'{job_id}.json')
+
+    def result_path(self, job_id):
+        """Return the path of a job's PDF"""
+        return os.path.join(self.directory, f'{job_id}.pdf')
+
+    def _write_state(self, job):
+        job['updated'] = time.time()
+        with tempfile.NamedTemporaryFile('w', dir=self.directory, suffix='.tmp',
+                                         delete=False) as f:
+            json.dump(job, f)
+        os.replace(f.name, self._state_path(job['id']))
+
+    def submit(self, data):
+        """Queue a payload for rendering and return the new job record"""
+        self.cleanup()
+        job = {
+            'id': uuid.uuid4().hex,
+            'status': 'queued',
+            'created': time.time(),
+        }
+        self._write_state(job)
+        with self._pending_lock:
+            self._pending[job['id']] = self._executor.submit(self._run, dict(job), data)
+            if self._heartbeat is None:
+                self._heartbeat = threading.Thread(
+                    target=self._touch_pending, name='render-job-heartbeat', daemon=True
+                )
+                self._heartbeat.start()
+        return job
+
+    def _touch_pending(self):
+        while not self._stopping.wait(JOB_HEARTBEAT_INTERVAL):
+            with self._pending_lock:
+                job_ids = list(self._pending)
+            for job_id in job_ids:
+                try:
+                    os.utime(self._state_path(job_id))
+                except FileNotFoundError:
+                    pass
+
+    def _run(self, job, data):
+        try:
+            self._execute(job, data)
+        finally:
+            with self._pending_lock:
+                self._pending.pop(job['id'], None)
+
+    def _execute(self, job, data):
+        job['status'] = 'running'
+        self._write_state(job)
+        try:
+            pdf_bytes = self.render(data)
+            with tempfile.NamedTemporaryFile(dir=self.directory, suffix='.tmp',
+                                             delete=False) as f:
+                f.write(pdf_bytes)
+            os.chmod(f.name, PDF_FILE_MODE)
+            os.replace(f.name, self.result_path(job['id']))
+            job['status'] = 'done'
+            job['size'] = len(pdf_bytes)
+        except Exception as e:
+            job['status'] = 'failed'
+            job['error'] = str(e)
+        self._write_state(job)
+
+    def get(self, job_id):
+        """Return a job record, or None if it is unknown or expired"""
+        if not _JOB_ID_RE.fullmatch(job_id):
+            return None
+        self.cleanup()
+        path = self._state_path(job_id)
+        try:
+            with open(path) as f:
+                job = json.load(f)
+            idle = time.time() - os.stat(path).st_mtime
+        except (FileNotFoundError, ValueError):
+            return None
+        if job['status'] in PENDING_STATUSES and idle > self.stale_after:
+            # Nothing has touched the job since its process went away
+            job['status'] = 'failed'
+            job['error'] = 'Job was interrupted by a server restart'
+            self._write_state(job)
+        return job
+
+    def cleanup(self, force=False):
+        """Delete jobs whose last state change is older than the TTL"""
+        now = time.time()
+        with self._cleanup_lock:
+            if not force and now - self._last_cleanup < JOB_CLEANUP_INTERVAL:
+                return
+            self._last_cleanup = now
+        for entry in os.scandir(self.directory):
+            try:
+                if now - entry.stat().st_mtime > self.ttl:
+                    os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+
+    def pending(self):
+        """Return the number of jobs this process accepted and has not finished"""
+        with self._pending_lock:
+            return len(self._pending)
+
+    def shutdown(self):
+        """Stop accepting jobs and finish the queued and running ones.
+
+        Only this process can run the jobs it accepted, so they are not
+        cancelled; a process killed before they finish leaves them to the
+        stale-job check in get().
+        """
+        self._executor.shutdown(wait=True)
+        self._stopping.set()
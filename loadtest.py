@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+"""
+Concurrency-sweep load test against a locally started server.
+
+Starts the API on a free local port (gunicorn with gunicorn.conf.py by
+default, or the Flask development server), waits for /ready, and then
+drives /convert-to-pdf with a fixed number of client threads per level.
+Nothing leaves the machine.
+
+    python loadtest.py
+    python loadtest.py --levels 1,2,4,8,16 --duration 30 --workers 4
+    python loadtest.py --server flask --json results.json
+
+For every concurrency level it prints throughput, p50/p95/p99 latency,
+the error rate (503s from admission control are counted separately) and
+the peak resident memory of the server and all of its worker processes.
+
+Each request gets a unique title so it misses the PDF cache and measures
+a full render; pass --cached to send the corpus unchanged instead.
+"""
+
+import argparse
+import http.client
+import json
+import os
+import random
+import re
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from benchmark import make_payload
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SAMPLE_FILE = os.path.join(HERE, 'test_api.py')
+READY_TIMEOUT = 120
+
+
+def load_sample():
+    """Return the BUET sample document from test_api.py.
+
+    The file is read as text rather than imported: it needs the requests
+    package and its literal has unescaped quotes inside string values,
+    which are repaired here before the list is parsed as JSON.
+    """
+    with open(SAMPLE_FILE, encoding='utf-8') as f:
+        text = f.read()
+    start = text.index('test_data = ') + len('test_data = ')
+    end = text.index('\ndef ', start)
+    lines = []
+    for line in text[start:end].splitlines():
+        match = re.match(r'^(\s*"[^"]+": ")(.*)("\s*,?\s*)$', line)
+        if match:
+            value = re.sub(r'(?<!\\)"', r'\"', match.group(2))
+            line = match.group(1) + value + match.group(3)
+        lines.append(line)
+    return json.loads('\n'.join(lines))[0]
+
+
+def build_corpus():
+    """Return (name, payload, weight) entries resembling real traffic"""
+    corpus = []
+    try:
+        corpus.append(('buet-sample', load_sample(), 6))
+    except (OSError, ValueError) as e:
+        print(f"Skipping the BUET sample: {e}", file=sys.stderr)
+    corpus.append(('bengali-50', make_payload(50, bengali=True), 3))
+    corpus.append(('english-300', make_payload(300), 1))
+    return corpus
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(kind, port, workers, spool_dir):
+    """Start the API in a child process and return the Popen"""
+    env = dict(os.environ, PDF_SPOOL_DIR=spool_dir, LOG_LEVEL='WARNING')
+    if kind == 'gunicorn':
+        env.update(BIND=f'127.0.0.1:{port}')
+        if workers:
+            env['WEB_CONCURRENCY'] = str(workers)
+        command = ['gunicorn', '-c', 'gunicorn.conf.py', 'app:create_app()']
+    else:
+        command = [
+            sys.executable, '-c',
+            'import sys; from app import create_app; '
+            'create_app().run(host="127.0.0.1", port=int(sys.argv[1]), threaded=True)',
+            str(port),
+        ]
+    # A session of its own, so render pool processes can be stopped with it
+    return subprocess.Popen(command, cwd=HERE, env=env, start_new_session=True)
+
+
+def stop_server(process):
+    """Stop the server, then anything left in its process group"""
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        pass
+    except ProcessLookupError:
+        return
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+    process.wait()
+
+
+def wait_ready(port, process, timeout=READY_TIMEOUT):
+    """Poll /ready until the server answers 200"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'Server exited with status {process.returncode}')
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+            connection.request('GET', '/ready')
+            if connection.getresponse().status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f'Server not ready after {timeout}s')
+
+
+def process_tree_rss(pid):
+    """Return the summed RSS in bytes of pid and its descendants (Linux)"""
+    children = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+    total = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        pending.extend(children.get(current, []))
+        try:
+            with open(f'/proc/{current}/statm') as f:
+                total += int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+        except (OSError, ValueError):
+            pass
+    return total
+
+
+class RSSSampler(threading.Thread):
+    """Record the peak process-tree RSS of the server while running"""
+
+    def __init__(self, pid, interval=0.5):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.peak = 0
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.is_set():
+            self.peak = max(self.peak, process_tree_rss(self.pid))
+            self.stopped.wait(self.interval)
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+        return self.peak
+
+
+def client(port, corpus, deadline, cached, results, seed):
+    """Send requests back to back on one keep-alive connection until deadline"""
+    rng = random.Random(seed)
+    names, payloads, weights = zip(*corpus)
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=300)
+    sequence = 0
+    while time.monotonic() < deadline:
+        payload = rng.choices(payloads, weights)[0]
+        if not cached:
+            sequence += 1
+            payload = dict(payload, title=f"{payload.get('title', '')} #{seed}-{sequence}")
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        start = time.perf_counter()
+        try:
+            connection.request('POST', '/convert-to-pdf', body,
+                               {'Content-Type': 'application/json'})
+            response = connection.getresponse()
+            response.read()
+            status = response.status
+        except (OSError, http.client.HTTPException):
+            status = None
+            connection.close()
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=300)
+        results.append((time.perf_counter() - start, status))
+    connection.close()
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an ascending list"""
+    if not sorted_values:
+        return float('nan')
+    index = max(0, min(len(sorted_values) - 1, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def run_level(port, pid, corpus, concurrency, duration, cached):
+    """Drive the server at one concurrency level and return its summary"""
+    results = []
+    sampler = RSSSampler(pid)
+    sampler.start()
+    started = time.monotonic()
+    deadline = started + duration
+    threads = [
+        threading.Thread(target=client,
+                         args=(port, corpus, deadline, cached, results, concurrency * 1000 + i))
+        for i in range(concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+    peak_rss = sampler.stop()
+
+    ok = sorted(latency for latency, status in results if status == 200)
+    busy = sum(1 for _, status in results if status == 503)
+    errors = sum(1 for _, status in results if status not in (200, 503))
+    total = len(results)
+    return {
+        'concurrency': concurrency,
+        'requests': total,
+        'throughput': len(ok) / elapsed,
+        'p50_ms': percentile(ok, 0.50) * 1000,
+        'p95_ms': percentile(ok, 0.95) * 1000,
+        'p99_ms': percentile(ok, 0.99) * 1000,
+        'busy_rate': busy / total if total else 0.0,
+        'error_rate': errors / total if total else 0.0,
+        'peak_rss_mb': peak_rss / 1e6,
+    }
+
+
+def print_summary(summary):
+    print(f"{summary['concurrency']:>5} {summary['requests']:>8} "
+          f"{summary['throughput']:>8.2f} {summary['p50_ms']:>9.0f} "
+          f"{summary['p95_ms']:>9.0f} {summary['p99_ms']:>9.0f} "
+          f"{summary['busy_rate']:>7.1%} {summary['error_rate']:>7.1%} "
+          f"{summary['peak_rss_mb']:>9.0f}")
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description='Concurrency-sweep load test')
+    parser.add_argument('--server', choices=['gunicorn', 'flask'], default='gunicorn')
+    parser.add_argument('--workers', type=int, default=0,
+                        help='gunicorn workers (default: WEB_CONCURRENCY or CPU count)')
+    parser.add_argument('--levels', default='1,2,4,8,16',
+                        help='comma-separated client concurrency levels')
+    parser.add_argument('--duration', type=float, default=20,
+                        help='seconds to run each level')
+    parser.add_argument('--cached', action='store_true',
+                        help='send identical payloads so repeats are cache hits')
+    parser.add_argument('--json', metavar='PATH', help='also write the results as JSON')
+    args = parser.parse_args(argv)
+    levels = [int(level) for level in args.levels.split(',')]
+
+    corpus = build_corpus()
+    port = free_port()
+    spool_dir = tempfile.mkdtemp(prefix='loadtest-spool-')
+    process = start_server(args.server, port, args.workers, spool_dir)
+    summaries = []
+    try:
+        wait_ready(port, process)
+        print(f"{args.server} on port {port}, corpus: "
+              + ', '.join(f'{name} x{weight}' for name, _, weight in corpus))
+        print(f"{'conc':>5} {'requests':>8} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} "
+              f"{'p99 ms':>9} {'503':>7} {'errors':>7} {'RSS MB':>9}")
+        for concurrency in levels:
+            summary = run_level(port, process.pid, corpus, concurrency,
+                                args.duration, args.cached)
+            summaries.append(summary)
+            print_summary(summary)
+    finally:
+        stop_server(process)
+        shutil.rmtree(spool_dir, ignore_errors=True)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'server': args.server, 'workers': args.workers,
+                       'duration': args.duration, 'levels': summaries}, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -169,7 +169,8 @@ backup_config() {
         docker-compose.prod.yml \
         nginx.conf \
         ssl/ \
-        app.py \
+        *.py \
+        static/ \
         requirements.txt \
         Dockerfile*
     
@@ -0,0 +1,391 @@
+"""In-process metrics in the Prometheus text exposition format.
+
+Histograms and counters are updated on the render hot path, so each thread
+writes to its own shard without taking a lock; shards are only summed when
+/metrics is scraped. When a thread exits its shard is folded into a retired
+total, so thread-per-request servers do not grow the shard list.
+
+With several server processes (gunicorn workers) set METRICS_DIR to a
+directory they share. Each process then writes a snapshot of its totals
+there every METRICS_FLUSH_INTERVAL seconds, and /metrics answers with the
+sum over all snapshots, whichever worker takes the scrape. Counters and
+histograms of exited workers are kept in a retired snapshot so totals never
+go backwards; their gauges are dropped.
+"""
+
+import json
+import os
+import tempfile
+import threading
+import time
+import weakref
+from bisect import bisect_left
+from contextlib import contextmanager
+
+METRICS_DIR = os.environ.get('METRICS_DIR', '')
+METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', 5))
+RETIRED_SNAPSHOT = 'retired.json'
+
+
+def _format_labels(labels):
+    pairs = ','.join(f'{key}="{value}"' for key, value in labels)
+    return '{' + pairs + '}' if pairs else ''
+
+
+class _Metric:
+    """Totals keyed by a tuple of label values, merged across processes"""
+
+    kind = None
+    # Gauges describe live processes only; counters outlive their process
+    live_only = False
+    # How gauges of several processes combine: 'sum' or 'max', or a dict of
+    # label values to one of those
+    mode = 'sum'
+
+    def totals(self):
+        raise NotImplementedError
+
+    def merge(self, into, totals):
+        for key, value in list(totals.items()):
+            mode = self.mode.get(key, 'sum') if isinstance(self.mode, dict) else self.mode
+            if mode == 'max' and key in into:
+                into[key] = max(into[key], value)
+            else:
+                into[key] = into.get(key, 0) + value
+
+    def dump(self, totals):
+        return [[list(key), value] for key, value in totals.items()]
+
+    def load(self, items):
+        return {tuple(key): value for key, value in items}
+
+    def format(self, totals):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} {self.kind}']
+        for key, value in sorted(totals.items()):
+            labels = _format_labels(zip(self.label_names, key))
+            lines.append(f'{self.name}{labels} {value}')
+        return lines
+
+    def collect(self):
+        return self.format(self.totals())
+
+    def reset(self):
+        pass
+
+
+class _ShardOwner:
+    """Thread-local handle whose finalizer retires the thread's shard"""
+
+    __slots__ = ('__weakref__',)
+
+
+class _Sharded(_Metric):
+    """Base for metrics whose per-thread state is summed at collection"""
+
+    def __init__(self):
+        self._shards_lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Forget all values, e.g. those a forked worker inherited"""
+        with self._shards_lock:
+            old_local = getattr(self, '_local', None)
+            self._local = threading.local()
+            self._shards = {}
+            self._retired = {}
+        # Dropping the old thread-locals runs their finalizers, which take
+        # the lock; their shards are no longer registered and are ignored
+        del old_local
+
+    def _shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = {}
+            owner = _ShardOwner()
+            self._local.shard = shard
+            self._local.owner = owner
+            # Only taken once per thread, when it first touches the metric
+            with self._shards_lock:
+                self._shards[id(shard)] = shard
+            # Thread-local values are dropped when the thread exits
+            weakref.finalize(owner, self._retire, shard)
+        return shard
+
+    def _retire(self, shard):
+        with self._shards_lock:
+            if self._shards.get(id(shard)) is shard:
+                del self._shards[id(shard)]
+                self.merge(self._retired, shard)
+
+    def totals(self):
+        totals = {}
+        with self._shards_lock:
+            self.merge(totals, self._retired)
+            shards = list(self._shards.values())
+        for shard in shards:
+            self.merge(totals, shard)
+        return totals
+
+
+class Counter(_Sharded):
+    """Monotonic counter, optionally split by a tuple of label values"""
+
+    kind = 'counter'
+
+    def __init__(self, name, help_text, label_names=()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        super().__init__()
+
+    def inc(self, *label_values, amount=1):
+        shard = self._shard()
+        shard[label_values] = shard.get(label_values, 0) + amount
+
+
+class Gauge(_Metric):
+    """Value that goes up and down, e.g. renders currently in flight"""
+
+    kind = 'gauge'
+    live_only = True
+    label_names = ()
+
+    def __init__(self, name, help_text, mode='sum'):
+        self.name = name
+        self.help_text = help_text
+        self.mode = mode
+        self._value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount=1):
+        with self._lock:
+            self._value -= amount
+
+    def set(self, value):
+        self._value = value
+
+    def totals(self):
+        return {(): self._value}
+
+    def reset(self):
+        self._value = 0
+
+
+class CallbackMetric(_Metric):
+    """Counter or gauge read from a function at collection time.
+
+    ``func`` returns a dict of label value tuples to numbers, e.g. the
+    counters a cache keeps itself.
+    """
+
+    def __init__(self, name, help_text, kind, label_names, func, mode='sum'):
+        self.name = name
+        self.help_text = help_text
+        self.kind = kind
+        self.live_only = kind == 'gauge'
+        self.label_names = tuple(label_names)
+        self.func = func
+        self.mode = mode
+
+    def totals(self):
+        return {tuple(key): value for key, value in self.func().items()}
+
+
+class Histogram(_Sharded):
+    """Fixed-bucket histogram, optionally split by one label"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, buckets, label_name=None):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(sorted(buckets))
+        self.label_name = label_name
+        super().__init__()
+
+    def merge(self, into, totals):
+        for label, series in list(totals.items()):
+            total = into.setdefault(label, [0] * len(series))
+            for i, value in enumerate(series):
+                total[i] += value
+
+    def dump(self, totals):
+        return [[label, series] for label, series in totals.items()]
+
+    def load(self, items):
+        return {label: series for label, series in items}
+
+    def observe(self, value, label=None):
+        shard = self._shard()
+        series = shard.get(label)
+        if series is None:
+            # One slot per bucket plus +Inf, then the running sum
+            series = shard[label] = [0] * (len(self.buckets) + 2)
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    @contextmanager
+    def time(self, label=None):
+        """Observe the wall time of the enclosed block in seconds"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, label)
+
+    def format(self, totals):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        for label, series in sorted(totals.items(), key=lambda item: str(item[0])):
+            base = [(self.label_name, label)] if self.label_name else []
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), series):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'{self.name}_bucket{_format_labels(base + [("le", le)])} {cumulative}')
+            lines.append(f'{self.name}_sum{_format_labels(base)} {series[-1]}')
+            lines.append(f'{self.name}_count{_format_labels(base)} {cumulative}')
+        return lines
+
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1, 2.5, 5, 10, 30, 60)
+SIZE_BUCKETS = (16e3, 64e3, 128e3, 256e3, 512e3, 1e6, 2e6, 5e6, 10e6, 50e6)
+PAGE_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100, 500)
+
+REQUESTS = Counter(
+    'http_requests_total', 'HTTP requests by method, route and status',
+    ('method', 'endpoint', 'status')
+)
+RENDER_STAGE_SECONDS = Histogram(
+    'pdf_render_stage_seconds',
+    'Time spent per render stage (normalize, html, layout, write)',
+    LATENCY_BUCKETS, label_name='stage'
+)
+PDF_BYTES = Histogram('pdf_output_bytes', 'Size of rendered PDFs in bytes', SIZE_BUCKETS)
+PDF_PAGES = Histogram('pdf_output_pages', 'Page count of rendered PDFs', PAGE_BUCKETS)
+RENDERS_IN_FLIGHT = Gauge('pdf_renders_in_flight', 'Renders submitted and not yet finished')
+RENDER_QUEUE_DEPTH = Gauge('pdf_render_queue_depth', 'Requests waiting for a render slot')
+RENDERS_REJECTED = Counter(
+    'pdf_renders_rejected_total', 'Renders refused by admission control, by reason',
+    ('reason',)
+)
+
+RENDERS_COALESCED = Counter(
+    'pdf_renders_coalesced_total', 'Requests that shared an identical render already in flight'
+)
+
+REGISTRY = [REQUESTS, RENDER_STAGE_SECONDS, PDF_BYTES, PDF_PAGES, RENDERS_IN_FLIGHT,
+            RENDER_QUEUE_DEPTH, RENDERS_REJECTED, RENDERS_COALESCED]
+
+
+def register(metric):
+    """Add a metric to the registry and return it"""
+    REGISTRY.append(metric)
+    return metric
+
+
+def observe_render(stats):
+    """Record the layout/write timings and output size of one render"""
+    RENDER_STAGE_SECONDS.observe(stats['layout'], 'layout')
+    RENDER_STAGE_SECONDS.observe(stats['write'], 'write')
+    PDF_BYTES.observe(stats['bytes'])
+    PDF_PAGES.observe(stats['pages'])
+
+
+def _write_json(path, data):
+    directory = os.path.dirname(path)
+    with tempfile.NamedTemporaryFile('w', dir=directory, suffix='.tmp',
+                                     delete=False) as f:
+        json.dump(data, f)
+    os.replace(f.name, path)
+
+
+def _read_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def write_snapshot(directory=METRICS_DIR):
+    """Write this process's totals where the other workers can read them"""
+    data = {metric.name: metric.dump(metric.totals()) for metric in REGISTRY}
+    _write_json(os.path.join(directory, f'{os.getpid()}.json'), data)
+
+
+def mark_process_dead(pid, directory=METRICS_DIR):
+    """Fold the counters and histograms of an exited worker into the
+    retired snapshot and drop its gauges; called from the gunicorn master"""
+    path = os.path.join(directory, f'{pid}.json')
+    snapshot = _read_json(path)
+    if snapshot:
+        retired_path = os.path.join(directory, RETIRED_SNAPSHOT)
+        retired = _read_json(retired_path)
+        for metric in REGISTRY:
+            if metric.live_only or metric.name not in snapshot:
+                continue
+            totals = metric.load(retired.get(metric.name, []))
+            metric.merge(totals, metric.load(snapshot[metric.name]))
+            retired[metric.name] = metric.dump(totals)
+        _write_json(retired_path, retired)
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _flush_periodically(directory, interval):
+    while True:
+        time.sleep(interval)
+        try:
+            write_snapshot(directory)
+        except OSError:
+            pass
+
+
+def start_worker(directory=METRICS_DIR, interval=METRICS_FLUSH_INTERVAL):
+    """Start a forked worker's metrics from zero and flush them periodically.
+
+    Without this a worker would also report whatever its parent recorded
+    before the fork, e.g. the warm-up render.
+    """
+    for metric in REGISTRY:
+        metric.reset()
+    if directory:
+        threading.Thread(
+            target=_flush_periodically, args=(directory, interval),
+            name='metrics-flush', daemon=True
+        ).start()
+
+
+def _combined_totals(directory):
+    write_snapshot(directory)
+    combined = {metric.name: {} for metric in REGISTRY}
+    for entry in os.scandir(directory):
+        if not entry.name.endswith('.json'):
+            continue
+        snapshot = _read_json(entry.path)
+        for metric in REGISTRY:
+            if metric.name in snapshot:
+                metric.merge(combined[metric.name], metric.load(snapshot[metric.name]))
+    return combined
+
+
+def render_metrics(extra_lines=()):
+    """Return the exposition text for all registered metrics, summed over
+    every worker when METRICS_DIR is set"""
+    lines = []
+    if METRICS_DIR:
+        combined = _combined_totals(METRICS_DIR)
+        for metric in REGISTRY:
+            lines.extend(metric.format(combined[metric.name]))
+    else:
+        for metric in REGISTRY:
+            lines.extend(metric.collect())
+    lines.extend(extra_lines)
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,273 @@
+"""Validation and normalization of request payloads.
+
+Every accepted payload shape (a document object, or a list whose items are
+document objects) is turned in a single pass into compact ``__slots__``
+records. Rendering, caching and batching then work from these records
+instead of probing the raw JSON again, and ``Document.canonical()`` gives
+a stable form to hash: payloads that differ only in ignored keys, or in
+sending ``sentence`` as a JSON string instead of an array, normalize to
+the same document.
+"""
+
+import json
+import os
+from datetime import datetime
+
+import pytz
+
+DHAKA = pytz.timezone('Asia/Dhaka')
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S GMT+6'
+
+# Per-document limits, checked before any rows are built so an oversized
+# document is rejected without further work
+MAX_VOCABULARY_ROWS = int(os.environ.get('MAX_VOCABULARY_ROWS', 20000))
+MAX_SENTENCE_ROWS = int(os.environ.get('MAX_SENTENCE_ROWS', 5000))
+MAX_MESSAGE_CHARS = int(os.environ.get('MAX_MESSAGE_CHARS', 200000))
+
+# Keys that may hold the vocabulary rows, in order of preference
+ITEM_KEYS = ('output', 'data', 'words')
+
+_JSON_KINDS = {dict: 'object', list: 'array', str: 'string', bool: 'boolean',
+               int: 'number', float: 'number', type(None): 'null'}
+
+
+class PayloadError(ValueError):
+    """Raised for a payload that cannot be rendered.
+
+    ``path`` points at the offending value, e.g. ``output[3].synonyms``.
+    """
+
+    def __init__(self, path, message):
+        super().__init__(f'{path}: {message}')
+        self.path = path
+        self.message = message
+
+
+class VocabRow:
+    """One vocabulary table row; synonyms and antonyms are joined for display"""
+
+    __slots__ = ('english', 'bengali', 'synonyms', 'antonyms')
+
+    def __init__(self, english, bengali, synonyms, antonyms):
+        self.english = english
+        self.bengali = bengali
+        self.synonyms = synonyms
+        self.antonyms = antonyms
+
+
+class SentenceRow:
+    """One sentence example row"""
+
+    __slots__ = ('word', 'meaning_bn', 'example_en', 'example_bn')
+
+    def __init__(self, word, meaning_bn, example_en, example_bn):
+        self.word = word
+        self.meaning_bn = meaning_bn
+        self.example_en = example_en
+        self.example_bn = example_bn
+
+
+class Document:
+    """One normalized notes document.
+
+    ``time`` is already converted to GMT+6 for display, or None when the
+    payload carried no time and the render time should be shown.
+    """
+
+    __slots__ = ('title', 'time', 'vocabulary', 'sentences', 'message')
+
+    def __init__(self, title, time, vocabulary, sentences, message):
+        self.title = title
+        self.time = time
+        self.vocabulary = vocabulary
+        self.sentences = sentences
+        self.message = message
+
+    def canonical(self):
+        """Return the document as nested lists, suitable for hashing"""
+        return [
+            self.title,
+            self.time,
+            [[r.english, r.bengali, r.synonyms, r.antonyms] for r in self.vocabulary],
+            [[r.word, r.meaning_bn, r.example_en, r.example_bn] for r in self.sentences],
+            self.message,
+        ]
+
+
+def _kind(value):
+    return _JSON_KINDS.get(type(value), type(value).__name__)
+
+
+def _path(prefix, key):
+    return f'{prefix}.{key}' if prefix else key
+
+
+def _string(value, path):
+    """Accept a string or number, treat null as empty, reject the rest"""
+    kind = type(value)
+    if kind is str:
+        return value
+    if value is None:
+        return ''
+    if kind is int or kind is float:
+        return str(value)
+    raise PayloadError(path, f'expected a string, got {_kind(value)}')
+
+
+def _word_list(value, path, index, key):
+    """Join a list of strings for display; a plain string is kept as is"""
+    kind = type(value)
+    if kind is list:
+        try:
+            return ', '.join(value)
+        except TypeError:
+            # Numbers are accepted like anywhere else; anything else is named
+            return ', '.join(_string(word, f'{path}[{index}].{key}[{i}]')
+                             for i, word in enumerate(value))
+    if kind is str:
+        return value
+    if value is None:
+        return ''
+    raise PayloadError(f'{path}[{index}].{key}', f'expected an array of strings, got {_kind(value)}')
+
+
+def _vocabulary(items, path):
+    rows = []
+    append = rows.append
+    # Paths are only formatted when a value turns out to be invalid
+    for i, item in enumerate(items):
+        if type(item) is not dict:
+            raise PayloadError(f'{path}[{i}]', f'expected an object, got {_kind(item)}')
+        get = item.get
+        english = get('english', '')
+        bengali = get('bengali', '')
+        synonyms = get('synonyms')
+        antonyms = get('antonyms')
+        append(VocabRow(
+            english if type(english) is str else _string(english, f'{path}[{i}].english'),
+            bengali if type(bengali) is str else _string(bengali, f'{path}[{i}].bengali'),
+            _word_list(synonyms, path, i, 'synonyms') if synonyms else '',
+            _word_list(antonyms, path, i, 'antonyms') if antonyms else ''
+        ))
+    return rows
+
+
+def _sentences(value, path):
+    """Accept sentence rows as an array or as a JSON-encoded array string"""
+    if type(value) is str:
+        if not value.strip():
+            return []
+        try:
+            value = json.loads(value)
+        except json.JSONDecodeError as e:
+            raise PayloadError(path, f'invalid JSON ({e.msg} at position {e.pos})') from None
+    if type(value) is not list:
+        raise PayloadError(path, f'expected an array, got {_kind(value)}')
+    if len(value) > MAX_SENTENCE_ROWS:
+        raise PayloadError(path, f'{len(value)} sentences exceed the limit of {MAX_SENTENCE_ROWS}')
+    rows = []
+    append = rows.append
+    for i, item in enumerate(value):
+        if type(item) is not dict:
+            raise PayloadError(f'{path}[{i}]', f'expected an object, got {_kind(item)}')
+        get = item.get
+        word = get('word', '')
+        meaning_bn = get('meaning_bn', '')
+        example_en = get('example_en', '')
+        example_bn = get('example_bn', '')
+        append(SentenceRow(
+            word if type(word) is str else _string(word, f'{path}[{i}].word'),
+            meaning_bn if type(meaning_bn) is str else _string(meaning_bn, f'{path}[{i}].meaning_bn'),
+            example_en if type(example_en) is str else _string(example_en, f'{path}[{i}].example_en'),
+            example_bn if type(example_bn) is str else _string(example_bn, f'{path}[{i}].example_bn')
+        ))
+    return rows
+
+
+def _display_time(value, path):
+    """Convert an ISO 8601 timestamp to the GMT+6 display form"""
+    if type(value) is not str:
+        raise PayloadError(path, f'expected an ISO 8601 timestamp, got {_kind(value)}')
+    try:
+        moment = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        raise PayloadError(path, f'not an ISO 8601 timestamp: {value[:64]!r}') from None
+    return moment.astimezone(DHAKA).strftime(TIME_FORMAT)
+
+
+def current_time():
+    """Return the current time in the GMT+6 display form"""
+    return datetime.now(DHAKA).strftime(TIME_FORMAT)
+
+
+def normalize_document(data, path=''):
+    """Validate one document object and return it as a Document"""
+    if type(data) is not dict:
+        raise PayloadError(path or '$', f'expected an object, got {_kind(data)}')
+
+    for key in ITEM_KEYS:
+        if key in data:
+            items = data[key]
+            items_path = _path(path, key)
+            if type(items) is not list:
+                raise PayloadError(items_path, f'expected an array, got {_kind(items)}')
+            break
+    else:
+        # A bare object is treated as a single vocabulary row
+        items = [data]
+        items_path = path or '$'
+    if len(items) > MAX_VOCABULARY_ROWS:
+        raise PayloadError(items_path, f'{len(items)} rows exceed the limit of {MAX_VOCABULARY_ROWS}')
+
+    content = ''
+    title = time = None
+    title_path = _path(path, 'title')
+    time_path = _path(path, 'time')
+    sentences = []
+    message = data.get('message')
+    message_path = _path(path, 'message')
+    if type(message) is dict:
+        content = _string(message.get('content'), message_path + '.content')
+        # Title and time inside the message take precedence over the root
+        title = message.get('title')
+        if title:
+            title_path = message_path + '.title'
+        time = message.get('time')
+        if time:
+            time_path = message_path + '.time'
+        sentence = message.get('sentence')
+        if sentence is not None:
+            sentences = _sentences(sentence, message_path + '.sentence')
+    elif type(message) is str:
+        content = message
+    elif message is not None:
+        raise PayloadError(message_path, f'expected an object or string, got {_kind(message)}')
+    if len(content) > MAX_MESSAGE_CHARS:
+        raise PayloadError(message_path, f'{len(content)} characters exceed the limit of {MAX_MESSAGE_CHARS}')
+
+    if not title:
+        title = data.get('title', 'No Title')
+    if not time:
+        time = data.get('time')
+
+    return Document(
+        _string(title, title_path),
+        _display_time(time, time_path) if time else None,
+        _vocabulary(items, items_path),
+        sentences,
+        content
+    )
+
+
+def normalize_payload(data, merge=False):
+    """Return the Documents of a payload.
+
+    A list payload renders its first item, or every item when merging.
+    """
+    if type(data) is list:
+        if not data:
+            raise PayloadError('$', 'expected a non-empty array')
+        if merge:
+            return [normalize_document(item, f'[{i}]') for i, item in enumerate(data)]
+        return [normalize_document(data[0], '[0]')]
+    return [normalize_document(data)]
@@ -0,0 +1,226 @@
+"""HTML rendering of the notes document.
+
+The markup is split into static fragments that are compiled once at import
+as format strings. Rows are appended to a list buffer and joined once,
+instead of growing one string per row, and every value taken from the
+payload is HTML-escaped. Payloads are validated and normalized by the
+normalize module first.
+
+Sections with more than LARGE_DOCUMENT_ROWS rows are built in large-document
+mode: the table is split into chunks of TABLE_CHUNK_ROWS rows, each with its
+own header, and the section is allowed to break across pages. One huge
+table kept on a single unbreakable block makes WeasyPrint layout time and
+memory grow much faster than the row count.
+
+For PDFs the stylesheet is applied by the render context; HTML previews
+for browsers carry it in the head instead, see stylesheet_tag.
+"""
+
+import os
+from html import escape
+
+from normalize import current_time
+
+# Bump whenever the fragments below, the normalization or static/notes.css
+# change the output, so cached PDFs rendered from the old template are
+# not served
+TEMPLATE_VERSION = '5'
+
+LARGE_DOCUMENT_ROWS = int(os.environ.get('LARGE_DOCUMENT_ROWS', 300))
+# Even, so the striped rows line up across chunks
+TABLE_CHUNK_ROWS = int(os.environ.get('TABLE_CHUNK_ROWS', 100))
+
+STYLESHEET_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'notes.css')
+_inline_style = None
+
+HEAD = """<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>AI Powered English Learning Notes{title}</title>
+{styles}</head>
+<body>
+"""
+
+TAIL = """</body>
+</html>
+"""
+
+DOCUMENT_OPEN = """<div class="document">
+"""
+
+DOCUMENT_CLOSE = """</div>
+"""
+
+DOCUMENT_HEADER = """    <div class="header">
+        <div class="main-title">AI Powered English Learning Notes from contemporary news</div>
+        <div class="news-title">{title}</div>
+        <div class="time-info">{time}</div>
+    </div>
+"""
+
+SECTION_OPEN = """    <div class="{classes}">
+        <div class="section-title">{title}</div>
+"""
+
+VOCABULARY_TABLE = """        <div class="table-container">
+            <table>
+                <thead>
+                    <tr>
+                        <th>S/N</th>
+                        <th>Word</th>
+                        <th>Meaning in Bengali</th>
+                        <th>Synonyms</th>
+                        <th>Antonyms</th>
+                    </tr>
+                </thead>
+                <tbody>
+"""
+
+VOCABULARY_ROW = """                    <tr>
+                        <td>{}</td>
+                        <td><strong>{}</strong></td>
+                        <td class="bengali-text">{}</td>
+                        <td class="synonyms">{}</td>
+                        <td class="antonyms">{}</td>
+                    </tr>
+"""
+
+SENTENCE_TABLE = """        <div class="table-container">
+            <table>
+                <thead>
+                    <tr>
+                        <th>S/N</th>
+                        <th>Word</th>
+                        <th>Meaning in Bengali</th>
+                        <th>Example Sentence (English)</th>
+                        <th>Example Sentence (Bengali)</th>
+                    </tr>
+                </thead>
+                <tbody>
+"""
+
+SENTENCE_ROW = """                    <tr>
+                        <td>{}</td>
+                        <td><strong>{}</strong></td>
+                        <td class="bengali-text">{}</td>
+                        <td class="sentence-example sentence-example-en">{}</td>
+                        <td class="bengali-text sentence-example sentence-example-bn">{}</td>
+                    </tr>
+"""
+
+TABLE_CLOSE = """                </tbody>
+            </table>
+        </div>
+"""
+
+SECTION_CLOSE = """    </div>
+"""
+
+TRANSLATION = """    <div class="section translation-section">
+        <div class="section-title">English-Bengali Phrase by Phrase Translation</div>
+        <div class="translation-content">
+            <div class="english-text">{message}</div>
+        </div>
+    </div>
+"""
+
+FOOTER = """    <div class="footer">
+        Generated by EnglishKaku  AI powered Workflow
+    </div>
+"""
+
+
+def stylesheet_tag(href=None):
+    """Return markup that applies the notes stylesheet in a browser.
+
+    With an href the page links to the stylesheet; otherwise it is
+    inlined in a ``<style>`` element, read from disk once per process.
+    """
+    global _inline_style
+    if href is not None:
+        return f'    <link rel="stylesheet" href="{escape(href)}">\n'
+    if _inline_style is None:
+        with open(STYLESHEET_PATH, encoding='utf-8') as f:
+            _inline_style = f'    <style>\n{f.read()}\n    </style>\n'
+    return _inline_style
+
+
+def render_table(title, table_open, cells, out, large_rows=LARGE_DOCUMENT_ROWS):
+    """Append a table section, chunked in large-document mode.
+
+    cells yields one tuple of already escaped cell values per row.
+    """
+    append = out.append
+    rows = len(cells)
+    large = rows > large_rows
+    append(SECTION_OPEN.format(
+        classes='section section-large' if large else 'section', title=title
+    ))
+    chunk = TABLE_CHUNK_ROWS if large else max(rows, 1)
+    for start in range(0, max(rows, 1), chunk):
+        append(table_open)
+        for i in range(start, min(start + chunk, rows)):
+            append(cells[i])
+        append(TABLE_CLOSE)
+    append(SECTION_CLOSE)
+
+
+def render_document(doc, out, large_rows=LARGE_DOCUMENT_ROWS):
+    """Append the markup for one normalized Document to the out buffer"""
+    append = out.append
+    append(DOCUMENT_HEADER.format(title=escape(doc.title), time=escape(doc.time or current_time())))
+    
+    row = VOCABULARY_ROW.format
+    render_table('Vocabulary Table', VOCABULARY_TABLE, [
+        row(
+            i,
+            escape(item.english),
+            escape(item.bengali),
+            escape(item.synonyms),
+            escape(item.antonyms)
+        )
+        for i, item in enumerate(doc.vocabulary, 1)
+    ], out, large_rows)
+    
+    if doc.sentences:
+        row = SENTENCE_ROW.format
+        render_table('Sentence Examples with Context', SENTENCE_TABLE, [
+            row(
+                i,
+                escape(sentence.word),
+                escape(sentence.meaning_bn),
+                escape(sentence.example_en),
+                escape(sentence.example_bn)
+            )
+            for i, sentence in enumerate(doc.sentences, 1)
+        ], out, large_rows)
+    
+    if doc.message:
+        append(TRANSLATION.format(message=escape(doc.message)))
+    
+    append(FOOTER)
+
+
+def documents_to_html(documents, merged=False, large_rows=LARGE_DOCUMENT_ROWS, styles=''):
+    """Build the HTML page for normalized documents.
+
+    A merged page wraps each document in its own ``.document`` block and
+    leaves the title generic; otherwise the single document is rendered
+    as is. Sections with more than large_rows rows use large-document mode.
+    styles is extra markup for the head, such as a stylesheet_tag.
+    """
+    if merged:
+        out = [HEAD.format(title='', styles=styles)]
+        for doc in documents:
+            out.append(DOCUMENT_OPEN)
+            render_document(doc, out, large_rows)
+            out.append(DOCUMENT_CLOSE)
+    else:
+        doc = documents[0]
+        out = [HEAD.format(title=' - ' + escape(doc.title), styles=styles)]
+        render_document(doc, out, large_rows)
+    out.append(TAIL)
+    return ''.join(out)
+
@@ -0,0 +1,296 @@
+"""Content-addressed cache for rendered PDFs.
+
+Entries are keyed by a hash of the normalized request payload plus the
+template version, so identical payloads are served without a new render.
+A small in-memory LRU sits in front of a larger spool directory on disk,
+which survives restarts and is served with sendfile.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+PDF_CACHE_MAX_BYTES = int(os.environ.get('PDF_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+PDF_SPOOL_DIR = os.environ.get(
+    'PDF_SPOOL_DIR', os.path.join(tempfile.gettempdir(), 'englishkaku-pdf-cache')
+)
+PDF_DISK_CACHE_MAX_BYTES = int(os.environ.get('PDF_DISK_CACHE_MAX_BYTES', 1024 * 1024 * 1024))
+PDF_DISK_CACHE_TTL = int(os.environ.get('PDF_DISK_CACHE_TTL', 7 * 24 * 3600))
+# Seconds between rescans of the spool for files other workers wrote
+PDF_DISK_CACHE_SCAN_INTERVAL = int(os.environ.get('PDF_DISK_CACHE_SCAN_INTERVAL', 30))
+# Disk hits up to this size are copied into the memory tier
+PDF_PROMOTE_MAX_BYTES = int(os.environ.get('PDF_PROMOTE_MAX_BYTES', 1024 * 1024))
+# Temporary files are created private; cached PDFs are made readable so a
+# front-end web server can send them itself (PDF_ACCEL_REDIRECT)
+PDF_FILE_MODE = 0o644
+
+
+def payload_digest(data, template_version):
+    """Return the SHA-256 hex digest of a payload for a template version"""
+    normalized = json.dumps(
+        data, sort_keys=True, separators=(',', ':'), ensure_ascii=False
+    )
+    digest = hashlib.sha256(template_version.encode('utf-8'))
+    digest.update(b'\0')
+    digest.update(normalized.encode('utf-8'))
+    return digest.hexdigest()
+
+
+class MemoryPDFCache:
+    """Thread-safe LRU of PDF bytes bounded by total size"""
+
+    def __init__(self, max_bytes=PDF_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """Return cached PDF bytes for key, or None"""
+        with self._lock:
+            pdf_bytes = self._entries.get(key)
+            if pdf_bytes is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return pdf_bytes
+
+    def put(self, key, pdf_bytes):
+        """Store PDF bytes, evicting least recently used entries as needed"""
+        size = len(pdf_bytes)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= len(old)
+            self._entries[key] = pdf_bytes
+            self._size += size
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+                self.evictions += 1
+
+    def stats(self):
+        """Return hit/miss/eviction counters and current usage"""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'bytes': self._size,
+                'max_bytes': self.max_bytes,
+            }
+
+
+class DiskPDFCache:
+    """PDF files in a spool directory with idle TTL and size-based eviction.
+
+    The file mtime records the last use, so the directory itself is the
+    index and several worker processes can share it safely. Each process
+    keeps a running total of its own writes and rescans the directory every
+    ``scan_interval`` seconds to pick up the other workers' files, so the
+    spool stays bounded however many workers fill it without walking it on
+    every write.
+    """
+
+    def __init__(self, directory=PDF_SPOOL_DIR, max_bytes=PDF_DISK_CACHE_MAX_BYTES,
+                 ttl=PDF_DISK_CACHE_TTL, scan_interval=PDF_DISK_CACHE_SCAN_INTERVAL):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.scan_interval = scan_interval
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._size = self._scan_size()
+        self._scanned = time.monotonic()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def path(self, key):
+        """Return the spool path for a key"""
+        return os.path.join(self.directory, f'{key}.pdf')
+
+    def get(self, key):
+        """Return the path of a fresh cached PDF for key, or None"""
+        path = self.path(key)
+        try:
+            stat = os.stat(path)
+            if time.time() - stat.st_mtime > self.ttl:
+                os.remove(path)
+                with self._lock:
+                    self._size = max(0, self._size - stat.st_size)
+                raise FileNotFoundError(path)
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return path
+
+    def put(self, key, pdf_bytes):
+        """Atomically write PDF bytes for key into the spool directory"""
+        size = len(pdf_bytes)
+        if size > self.max_bytes:
+            return
+        with tempfile.NamedTemporaryFile(dir=self.directory, suffix='.tmp',
+                                         delete=False) as f:
+            f.write(pdf_bytes)
+        os.chmod(f.name, PDF_FILE_MODE)
+        os.replace(f.name, self.path(key))
+        self._check_budget(size)
+
+    def adopt(self, key, path):
+        """Move a finished PDF file from the spool directory into the cache.
+
+        A file too large for the cache is removed instead; a reader that
+        already opened it can still finish.
+        """
+        size = os.path.getsize(path)
+        if size > self.max_bytes:
+            os.remove(path)
+            return
+        os.chmod(path, PDF_FILE_MODE)
+        os.replace(path, self.path(key))
+        self._check_budget(size)
+
+    def _check_budget(self, added):
+        now = time.monotonic()
+        with self._lock:
+            self._size += added
+            over_budget = self._size > self.max_bytes
+            rescan = now - self._scanned >= self.scan_interval
+            if rescan:
+                self._scanned = now
+        if rescan and not over_budget:
+            # Other worker processes write to the same directory, so their
+            # files count against the budget too
+            size = self._scan_size()
+            with self._lock:
+                self._size = size
+            over_budget = size > self.max_bytes
+        if over_budget:
+            self.sweep()
+
+    def sweep(self):
+        """Remove expired files, then least recently used ones until the
+        spool is back under 90% of its budget"""
+        now = time.time()
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.tmp'):
+                # Spool files left behind by a worker that died mid-render
+                self._remove_stale(entry.path, now)
+                continue
+            if not entry.name.endswith('.pdf'):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        target = self.max_bytes * 0.9
+        removed = 0
+        for mtime, size, path in entries:
+            if now - mtime <= self.ttl and total <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed += 1
+        with self._lock:
+            self._size = total
+            self._scanned = time.monotonic()
+            self.evictions += removed
+
+    def _remove_stale(self, path, now, age=3600):
+        try:
+            if now - os.stat(path).st_mtime > age:
+                os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def _scan_size(self):
+        total = 0
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith('.pdf'):
+                continue
+            try:
+                total += entry.stat().st_size
+            except FileNotFoundError:
+                # Swept by another worker since the directory was listed
+                pass
+        return total
+
+    def stats(self):
+        """Return hit/miss/eviction counters and approximate usage"""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'bytes': self._size,
+                'max_bytes': self.max_bytes,
+                'ttl': self.ttl,
+                'directory': self.directory,
+            }
+
+
+class TieredPDFCache:
+    """Memory LRU in front of the disk spool.
+
+    New PDFs are written to both tiers. Small disk hits are promoted back
+    into memory; large ones stay on disk so they can be sent with sendfile.
+    """
+
+    def __init__(self, memory=None, disk=None, promote_max_bytes=PDF_PROMOTE_MAX_BYTES):
+        self.memory = memory or MemoryPDFCache()
+        self.disk = disk or DiskPDFCache()
+        self.promote_max_bytes = promote_max_bytes
+
+    def get(self, key):
+        """Return (pdf_bytes, None) from memory, (None, path) from disk,
+        or (None, None) on a miss"""
+        pdf_bytes = self.memory.get(key)
+        if pdf_bytes is not None:
+            return pdf_bytes, None
+        path = self.disk.get(key)
+        if path is None:
+            return None, None
+        if os.path.getsize(path) <= self.promote_max_bytes:
+            with open(path, 'rb') as f:
+                self.memory.put(key, f.read())
+        return None, path
+
+    def put(self, key, pdf_bytes):
+        """Store a freshly rendered PDF in both tiers"""
+        self.memory.put(key, pdf_bytes)
+        self.disk.put(key, pdf_bytes)
+
+    def put_file(self, key, path):
+        """Store a freshly rendered PDF that was spooled to disk.
+
+        Spooled PDFs are larger than the memory tier should hold, so only
+        the disk tier takes them.
+        """
+        self.disk.adopt(key, path)
+
+    def stats(self):
+        """Return per-tier counters"""
+        return {'memory': self.memory.stats(), 'disk': self.disk.stats()}
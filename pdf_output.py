@@ -0,0 +1,143 @@
+"""Spooled PDF output.
+
+Renders write the PDF into a SpoolFile instead of building it as one bytes
+object. Small PDFs stay in memory and are returned as bytes; once a PDF
+grows past PDF_MEMORY_MAX_BYTES it spills to a named file in the spool
+directory, and only its path is handed back from the render worker. The
+web process moves that file into the disk cache and streams it to the
+client in chunks.
+"""
+
+import io
+import os
+import tempfile
+
+from pdf_cache import PDF_SPOOL_DIR
+
+PDF_MEMORY_MAX_BYTES = int(os.environ.get('PDF_MEMORY_MAX_BYTES', 1024 * 1024))
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+class SpoolFile:
+    """Write-only file that keeps data in memory up to max_size bytes and
+    then rolls over to a named file in directory.
+
+    This is tempfile.SpooledTemporaryFile, except that the rolled-over file
+    has a name, so it can be passed from a worker process to the web
+    process and moved into the disk cache without copying.
+    """
+
+    def __init__(self, max_size=PDF_MEMORY_MAX_BYTES, directory=PDF_SPOOL_DIR):
+        self.max_size = max_size
+        self.directory = directory
+        self._buffer = io.BytesIO()
+        self._file = None
+
+    def write(self, data):
+        if self._file is None:
+            if self._buffer.tell() + len(data) <= self.max_size:
+                return self._buffer.write(data)
+            self._rollover()
+        return self._file.write(data)
+
+    def _rollover(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self._file = tempfile.NamedTemporaryFile(dir=self.directory, suffix='.tmp',
+                                                 delete=False)
+        self._file.write(self._buffer.getbuffer())
+        self._buffer = None
+
+    def tell(self):
+        return (self._buffer if self._file is None else self._file).tell()
+
+    def flush(self):
+        if self._file is not None:
+            self._file.flush()
+
+    def finish(self):
+        """Return (pdf_bytes, None) if the data stayed in memory, otherwise
+        (None, path) of the closed spill file"""
+        if self._file is None:
+            return self._buffer.getvalue(), None
+        self._file.close()
+        return None, self._file.name
+
+    def discard(self):
+        """Drop the data, removing the spill file if there is one"""
+        if self._file is not None:
+            self._file.close()
+            try:
+                os.remove(self._file.name)
+            except FileNotFoundError:
+                pass
+        self._buffer = None
+
+
+def render_to_spool(context, html_content, max_size=PDF_MEMORY_MAX_BYTES, profile=None):
+    """Render HTML with a RenderContext and output profile into a SpoolFile.
+
+    Returns ``((pdf_bytes, path), stats)`` where exactly one of pdf_bytes
+    and path is set.
+    """
+    spool = SpoolFile(max_size)
+    try:
+        _, stats = context.render_pdf(html_content, spool, profile)
+    except BaseException:
+        spool.discard()
+        raise
+    return spool.finish(), stats
+
+
+class SharedSpoolFile:
+    """A spooled PDF that is deleted at once but readable until released.
+
+    Used for PDFs too large for the disk cache: the file is opened and
+    unlinked here, and every request that waited on the render streams it
+    through its own reader. The space is freed when the last reader and
+    this object are gone.
+    """
+
+    def __init__(self, path):
+        self._file = open(path, 'rb')
+        os.remove(path)
+        self.size = os.fstat(self._file.fileno()).st_size
+
+    def open(self):
+        """Return a new binary reader with its own position"""
+        return io.BufferedReader(_SharedFileReader(self))
+
+
+class _SharedFileReader(io.RawIOBase):
+    """Raw reader of a SharedSpoolFile at an independent offset"""
+
+    def __init__(self, shared):
+        self._shared = shared
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = os.pread(self._shared._file.fileno(), len(buffer), self._position)
+        buffer[:len(data)] = data
+        self._position += len(data)
+        return len(data)
+
+    def fileno(self):
+        return self._shared._file.fileno()
+
+    def close(self):
+        # Only this reader's reference goes; the shared file stays open
+        # for the others
+        super().close()
+        self._shared = None
+
+
+def iter_file(f, chunk_size=STREAM_CHUNK_SIZE):
+    """Yield the contents of an open file in chunks, closing it at the end"""
+    with f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
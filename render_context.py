@@ -0,0 +1,194 @@
+"""Process-wide WeasyPrint render context.
+
+The font configuration and the notes stylesheet are identical for every
+request, so they are built once per process and shared by all renders.
+Fonts are loaded from local files and remote URLs are refused, so a render
+never touches the network.
+"""
+
+import mimetypes
+import os
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import unquote, urlparse
+
+from weasyprint import HTML, CSS, default_url_fetcher, path2url
+from weasyprint.text.fonts import FontConfiguration
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+STYLESHEET_PATH = os.path.join(BASE_DIR, 'static', 'notes.css')
+FONT_DIR = os.path.abspath(os.environ.get('FONT_DIR', os.path.join(BASE_DIR, 'fonts')))
+
+# Noto Sans Bengali files looked up in FONT_DIR, with their CSS weight
+FONT_FACES = [
+    ('NotoSansBengali-Regular.ttf', 400),
+    ('NotoSansBengali-Medium.ttf', 500),
+    ('NotoSansBengali-Bold.ttf', 700),
+]
+
+# Named WeasyPrint options, selectable per request. 'fast' embeds whole
+# fonts and leaves streams uncompressed, skipping subsetting and zlib at
+# the cost of much larger files. There is no smaller profile: the defaults
+# already subset fonts without hinting and compress streams, and the image
+# options have nothing to work on in the notes template.
+PDF_PROFILES = {
+    'fast': {'uncompressed_pdf': True, 'full_fonts': True},
+    'default': {},
+}
+PDF_PROFILE = os.environ.get('PDF_PROFILE', 'default')
+if PDF_PROFILE not in PDF_PROFILES:
+    raise ValueError(f"PDF_PROFILE must be one of {', '.join(PDF_PROFILES)}")
+
+ALLOW_REMOTE_URLS = os.environ.get('ALLOW_REMOTE_URLS', '0') == '1'
+URL_CACHE_MAX_BYTES = int(os.environ.get('URL_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+
+
+class RemoteURLRefused(ValueError):
+    """Raised by LocalURLFetcher for resources outside the allowed roots"""
+
+
+class LocalURLFetcher:
+    """WeasyPrint url_fetcher serving local resources from an in-memory LRU.
+
+    Only ``file:`` URLs below one of the allowed directories and inline
+    ``data:`` URLs are served. Anything else is refused unless remote
+    fetching has been explicitly enabled with ``ALLOW_REMOTE_URLS=1``.
+    """
+
+    def __init__(self, allowed_dirs, max_bytes=URL_CACHE_MAX_BYTES,
+                 allow_remote=ALLOW_REMOTE_URLS):
+        self.allowed_dirs = [os.path.join(os.path.abspath(d), '') for d in allowed_dirs]
+        self.max_bytes = max_bytes
+        self.allow_remote = allow_remote
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, url, timeout=10, ssl_context=None):
+        scheme = urlparse(url).scheme
+        if scheme == 'data':
+            return default_url_fetcher(url, timeout, ssl_context)
+        if scheme == 'file':
+            return self._fetch_file(url)
+        if self.allow_remote:
+            return default_url_fetcher(url, timeout, ssl_context)
+        raise RemoteURLRefused(f'Remote URL refused: {url}')
+
+    def _fetch_file(self, url):
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is not None:
+                self._entries.move_to_end(url)
+        if entry is None:
+            path = os.path.abspath(unquote(urlparse(url).path))
+            if not any(path.startswith(d) for d in self.allowed_dirs):
+                raise RemoteURLRefused(f'File outside allowed directories: {path}')
+            with open(path, 'rb') as f:
+                data = f.read()
+            entry = (data, mimetypes.guess_type(path)[0])
+            self._store(url, entry)
+        data, mime_type = entry
+        return {'string': data, 'mime_type': mime_type, 'redirected_url': url}
+
+    def _store(self, url, entry):
+        size = len(entry[0])
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if url in self._entries:
+                return
+            self._entries[url] = entry
+            self._size += size
+            while self._size > self.max_bytes:
+                _, (old_data, _) = self._entries.popitem(last=False)
+                self._size -= len(old_data)
+
+
+def font_face_css(font_dir=FONT_DIR):
+    """Build @font-face rules for the bundled font files that are present"""
+    rules = []
+    for filename, weight in FONT_FACES:
+        path = os.path.join(font_dir, filename)
+        if not os.path.isfile(path):
+            continue
+        rules.append(
+            "@font-face {\n"
+            "    font-family: 'Noto Sans Bengali';\n"
+            f"    font-weight: {weight};\n"
+            f"    src: url('{path2url(path)}') format('truetype');\n"
+            "}\n"
+        )
+    return '\n'.join(rules)
+
+
+class RenderContext:
+    """Warm FontConfiguration plus the stylesheets pre-parsed against it"""
+
+    def __init__(self):
+        self.pid = os.getpid()
+        self.font_config = FontConfiguration()
+        self.url_fetcher = LocalURLFetcher([BASE_DIR, FONT_DIR])
+        # CSS objects must be parsed with the same FontConfiguration that is
+        # later passed to write_pdf, otherwise @font-face rules are lost
+        self.stylesheets = [
+            CSS(string=font_face_css(), base_url=BASE_DIR,
+                url_fetcher=self.url_fetcher, font_config=self.font_config),
+            CSS(filename=STYLESHEET_PATH, url_fetcher=self.url_fetcher,
+                font_config=self.font_config),
+        ]
+
+    def html(self, html_content):
+        """Parse an HTML string relative to the application directory"""
+        return HTML(string=html_content, base_url=BASE_DIR,
+                    url_fetcher=self.url_fetcher)
+
+    def layout(self, html_content, options=None):
+        """Lay out an HTML string and return the WeasyPrint Document"""
+        return self.html(html_content).render(
+            stylesheets=self.stylesheets,
+            font_config=self.font_config,
+            **(options or {})
+        )
+
+    def render_pdf(self, html_content, target=None, profile=None):
+        """Render an HTML string to PDF and return ``(pdf_bytes, stats)``.
+
+        With a target file object the PDF is written there as it is
+        serialized and pdf_bytes is None. profile names one of
+        PDF_PROFILES, PDF_PROFILE by default. Layout and serialization are
+        timed separately; the stats dict is small enough to send back from
+        a worker process.
+        """
+        options = PDF_PROFILES[profile or PDF_PROFILE]
+        start = time.perf_counter()
+        document = self.layout(html_content, options)
+        laid_out = time.perf_counter()
+        pdf_bytes = document.write_pdf(target, **options)
+        stats = {
+            'layout': laid_out - start,
+            'write': time.perf_counter() - laid_out,
+            'pages': len(document.pages),
+            'bytes': len(pdf_bytes) if target is None else target.tell(),
+        }
+        return pdf_bytes, stats
+
+
+_context = None
+_context_lock = threading.Lock()
+
+
+def get_render_context():
+    """Return the render context for this process, building it on first use.
+
+    The context is keyed by PID so that a forked worker builds its own
+    instead of reusing the parent's fontconfig state and temporary font files.
+    """
+    global _context
+    context = _context
+    if context is not None and context.pid == os.getpid():
+        return context
+    with _context_lock:
+        if _context is None or _context.pid != os.getpid():
+            _context = RenderContext()
+        return _context
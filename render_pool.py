@@ -0,0 +1,241 @@
+"""Pool of warm worker processes for WeasyPrint renders.
+
+WeasyPrint layout is CPU-bound and holds the GIL, so renders are handed to
+separate processes. Workers are forked from a server process that has
+already imported WeasyPrint, and each one builds its render context (fonts
+and stylesheets) before taking work.
+
+Renders are admitted through an AdmissionLimiter: a fixed number run at
+once, a few more may wait briefly, and the rest are rejected immediately
+with an estimate of when to retry.
+"""
+
+import math
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import CancelledError, Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import metrics
+from pdf_output import render_to_spool
+from render_context import get_render_context
+
+RENDER_POOL_SIZE = int(os.environ.get('RENDER_POOL_SIZE', os.cpu_count() or 1))
+RENDER_POOL_MAX_TASKS = int(os.environ.get('RENDER_POOL_MAX_TASKS', 200))
+# Renders running at once; in-process renders share one GIL, so more than
+# one per process only makes every render slower
+RENDER_CONCURRENCY = int(os.environ.get('RENDER_CONCURRENCY', max(RENDER_POOL_SIZE, 1)))
+RENDER_QUEUE_SIZE = int(os.environ.get('RENDER_QUEUE_SIZE', 2 * RENDER_CONCURRENCY))
+RENDER_QUEUE_TIMEOUT = float(os.environ.get('RENDER_QUEUE_TIMEOUT', 10))
+RENDER_TIMEOUT = float(os.environ.get('RENDER_TIMEOUT', 120))
+RETRY_AFTER_MAX = 60
+
+
+class RenderPoolBusy(Exception):
+    """Raised when a render is not admitted; ``retry_after`` is in seconds"""
+
+    def __init__(self, message, retry_after=1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class AdmissionLimiter:
+    """Bounded concurrency with a short, bounded wait queue.
+
+    Up to ``limit`` renders hold a slot at once and up to ``queue_size``
+    more callers wait for one, each for at most ``timeout`` seconds.
+    Callers beyond that are rejected at once instead of piling onto the
+    CPUs and slowing every render down together.
+    """
+
+    def __init__(self, limit=RENDER_CONCURRENCY, queue_size=RENDER_QUEUE_SIZE,
+                 timeout=RENDER_QUEUE_TIMEOUT):
+        self.limit = max(limit, 1)
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.active = 0
+        self.waiting = 0
+        # Moving average of slot hold time, for Retry-After
+        self.average_seconds = None
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        """Take a slot, waiting briefly if the queue has room, or raise RenderPoolBusy"""
+        with self._cond:
+            if self.active < self.limit:
+                self.active += 1
+                return
+            if self.waiting >= self.queue_size:
+                metrics.RENDERS_REJECTED.inc('queue_full')
+                raise RenderPoolBusy('Render queue is full', self.retry_after())
+            self.waiting += 1
+            # inc/dec rather than set: the batch pool has a limiter of its own
+            metrics.RENDER_QUEUE_DEPTH.inc()
+            try:
+                deadline = time.monotonic() + self.timeout
+                while self.active >= self.limit:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        metrics.RENDERS_REJECTED.inc('queue_timeout')
+                        raise RenderPoolBusy('Timed out waiting for a render slot',
+                                             self.retry_after())
+                    self._cond.wait(remaining)
+                self.active += 1
+            finally:
+                self.waiting -= 1
+                metrics.RENDER_QUEUE_DEPTH.dec()
+
+    def release(self, seconds=None):
+        """Free a slot, recording how long it was held"""
+        with self._cond:
+            self.active -= 1
+            if seconds is not None:
+                if self.average_seconds is None:
+                    self.average_seconds = seconds
+                else:
+                    self.average_seconds = 0.8 * self.average_seconds + 0.2 * seconds
+            self._cond.notify()
+
+    def retry_after(self):
+        """Whole seconds until the work ahead of a new caller should be done"""
+        per_render = self.average_seconds or 1.0
+        ahead = self.active + self.waiting
+        return max(1, min(RETRY_AFTER_MAX, math.ceil(ahead * per_render / self.limit)))
+
+
+def _warm_worker():
+    get_render_context()
+
+
+def _ping():
+    return os.getpid()
+
+
+def _render_pdf(html_content, profile=None):
+    return render_to_spool(get_render_context(), html_content, profile=profile)
+
+
+class RenderPool:
+    """Admission-controlled front end to a ProcessPoolExecutor of warm
+    render workers.
+
+    A size of 0 renders in the calling process instead. Either way every
+    render first takes a slot from the pool's AdmissionLimiter.
+    """
+
+    def __init__(self, size=RENDER_POOL_SIZE, max_tasks=RENDER_POOL_MAX_TASKS,
+                 admission=None, timeout=RENDER_TIMEOUT):
+        self.size = size
+        self.max_tasks = max_tasks
+        self.admission = admission or AdmissionLimiter()
+        self.timeout = timeout
+        # Finished renders, used to recycle long-lived processes; updated
+        # without a lock, so it is approximate under concurrency
+        self.completed = 0
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Fork and warm all workers, or build the in-process context"""
+        if self.size <= 0:
+            get_render_context()
+            return
+        with self._lock:
+            if self._executor is None:
+                self._executor = self._create_executor()
+
+    def _create_executor(self):
+        if 'forkserver' in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context('forkserver')
+            # Workers fork from a server that already imported WeasyPrint
+            context.set_forkserver_preload(['render_context'])
+        else:
+            context = multiprocessing.get_context('spawn')
+        executor = ProcessPoolExecutor(
+            max_workers=self.size,
+            mp_context=context,
+            initializer=_warm_worker,
+            max_tasks_per_child=self.max_tasks or None
+        )
+        # One task per worker makes the executor start all of them now
+        # rather than on demand
+        for future in [executor.submit(_ping) for _ in range(self.size)]:
+            future.result()
+        return executor
+
+    def _restart(self, broken):
+        with self._lock:
+            if self._executor is broken:
+                broken.shutdown(wait=False, cancel_futures=True)
+                self._executor = self._create_executor()
+            return self._executor
+
+    def submit(self, html_content, profile=None):
+        """Queue an HTML string for rendering with an output profile and
+        return a Future of ``(pdf_bytes, path)``, see pdf_output.render_to_spool.
+
+        Waits briefly for a slot when all are taken and raises
+        RenderPoolBusy when the wait queue is full or the wait times out.
+        """
+        self.admission.acquire()
+        started = time.monotonic()
+        metrics.RENDERS_IN_FLIGHT.inc()
+        if self.size <= 0:
+            future = Future()
+            try:
+                output, stats = _render_pdf(html_content, profile)
+                metrics.observe_render(stats)
+                future.set_result(output)
+            except Exception as e:
+                future.set_exception(e)
+            finally:
+                metrics.RENDERS_IN_FLIGHT.dec()
+                self.admission.release(time.monotonic() - started)
+                self.completed += 1
+            return future
+        try:
+            self.start()
+            executor = self._executor
+            try:
+                future = executor.submit(_render_pdf, html_content, profile)
+            except BrokenProcessPool:
+                # A worker died; replace the pool and retry once
+                future = self._restart(executor).submit(_render_pdf, html_content, profile)
+        except BaseException:
+            self.admission.release()
+            metrics.RENDERS_IN_FLIGHT.dec()
+            raise
+        # The slot is held until the worker finishes, even if we stop waiting
+        result = Future()
+        result.set_running_or_notify_cancel()
+        future.add_done_callback(lambda done: self._finish(done, result, started))
+        return result
+
+    def _finish(self, worker_future, result, started):
+        """Free the slot, record the worker's stats and resolve the caller's Future"""
+        self.admission.release(time.monotonic() - started)
+        metrics.RENDERS_IN_FLIGHT.dec()
+        self.completed += 1
+        if worker_future.cancelled():
+            result.set_exception(CancelledError('Render was cancelled'))
+            return
+        error = worker_future.exception()
+        if error is not None:
+            result.set_exception(error)
+            return
+        output, stats = worker_future.result()
+        metrics.observe_render(stats)
+        result.set_result(output)
+
+    def render(self, html_content, profile=None):
+        """Render an HTML string in a worker process and return ``(pdf_bytes, path)``"""
+        return self.submit(html_content, profile).result(timeout=self.timeout)
+
+    def shutdown(self):
+        """Stop all workers"""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
@@ -0,0 +1,80 @@
+"""Coalescing of concurrent identical work.
+
+Requests for the same key that arrive while a render for it is still
+running share that render's result instead of starting their own. Unlike
+the PDF cache this only covers work in flight: once a call finishes its
+key is forgotten, and later requests are served by the cache.
+"""
+
+import threading
+from concurrent.futures import CancelledError, Future
+
+import metrics
+
+
+class SingleFlight:
+    """Run at most one call per key at a time and share its result.
+
+    The shared Future is marked running before it is handed out, so one
+    waiter cannot cancel it for the others; a cancelled or failed call is
+    delivered to every waiter as its exception.
+    """
+
+    def __init__(self):
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def run(self, key, start, finish=None):
+        """Return a Future shared by every concurrent call for key.
+
+        Only the first caller runs ``start()``, which must return a Future.
+        ``finish(result)``, if given, runs once on the result before it is
+        shared; an exception from either one fails every waiter.
+        """
+        with self._lock:
+            shared = self._flights.get(key)
+            if shared is not None:
+                metrics.RENDERS_COALESCED.inc()
+                return shared
+            shared = Future()
+            shared.set_running_or_notify_cancel()
+            self._flights[key] = shared
+        try:
+            future = start()
+        except BaseException as e:
+            self._resolve(key, shared, error=e)
+            raise
+        future.add_done_callback(lambda done: self._complete(key, shared, done, finish))
+        return shared
+
+    def _complete(self, key, shared, future, finish):
+        if future.cancelled():
+            self._resolve(key, shared, error=CancelledError('Render was cancelled'))
+            return
+        error = future.exception()
+        if error is not None:
+            self._resolve(key, shared, error=error)
+            return
+        try:
+            result = future.result()
+            if finish is not None:
+                result = finish(result)
+        except Exception as e:
+            self._resolve(key, shared, error=e)
+            return
+        self._resolve(key, shared, result=result)
+
+    def _resolve(self, key, shared, result=None, error=None):
+        # Forget the key first: anyone arriving after this point should find
+        # the finished result in the cache, not wait on a completed flight
+        with self._lock:
+            if self._flights.get(key) is shared:
+                del self._flights[key]
+        if error is not None:
+            shared.set_exception(error)
+        else:
+            shared.set_result(result)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._flights)
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Memory tests for spooled PDF output; needs neither WeasyPrint nor a server.
+
+    python -m unittest test_pdf_output
+"""
+
+import io
+import os
+import shutil
+import tempfile
+import tracemalloc
+import unittest
+
+from pdf_output import SpoolFile
+
+MAX_SIZE = 1024 * 1024
+CHUNK = b'%PDF' * (16 * 1024)
+TOTAL_BYTES = 8 * MAX_SIZE
+
+
+def traced_peak(func):
+    """Return (result, tracemalloc peak in bytes) of func()"""
+    tracemalloc.start()
+    try:
+        result = func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, peak
+
+
+def write_chunks(target):
+    for _ in range(TOTAL_BYTES // len(CHUNK)):
+        target.write(CHUNK)
+
+
+class SpoolFileMemoryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='spool-test-')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def spool_large_pdf(self):
+        spool = SpoolFile(MAX_SIZE, self.directory)
+        write_chunks(spool)
+        return spool.finish()
+
+    def test_large_output_peak_stays_near_memory_limit(self):
+        (pdf_bytes, path), peak = traced_peak(self.spool_large_pdf)
+        self.assertIsNone(pdf_bytes)
+        self.assertEqual(os.path.getsize(path), TOTAL_BYTES)
+        self.assertLess(peak, MAX_SIZE + 4 * len(CHUNK))
+
+    def test_peak_is_lower_than_building_bytes(self):
+        def build_bytes():
+            # What write_pdf() without a target does
+            buffer = io.BytesIO()
+            write_chunks(buffer)
+            return buffer.getvalue()
+
+        _, spooled_peak = traced_peak(self.spool_large_pdf)
+        _, bytes_peak = traced_peak(build_bytes)
+        self.assertGreaterEqual(bytes_peak, TOTAL_BYTES)
+        self.assertLess(spooled_peak, bytes_peak / 4)
+
+    def test_small_output_stays_in_memory(self):
+        spool = SpoolFile(MAX_SIZE, self.directory)
+        spool.write(CHUNK)
+        pdf_bytes, path = spool.finish()
+        self.assertEqual(pdf_bytes, CHUNK)
+        self.assertIsNone(path)
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_discard_removes_spill_file(self):
+        spool = SpoolFile(MAX_SIZE, self.directory)
+        write_chunks(spool)
+        spool.discard()
+        self.assertEqual(os.listdir(self.directory), [])
+
+
+if __name__ == '__main__':
+    unittest.main()